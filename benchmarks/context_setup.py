@@ -0,0 +1,68 @@
+"""Mikro benchmark - cena vytvoreni kontextu pro jeden GraphQL pozadavek.
+
+Porovnava puvodni reseni (trida Loaders vytvarena pri kazdem pozadavku, kontext logovan na urovni INFO)
+s tridou Loaders vytvorenou jednou pri importu (src.Dataloaders.Loaders).
+
+    python -m benchmarks.context_setup
+"""
+import asyncio
+import io
+import logging
+import timeit
+from functools import cache
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from uoishelpers.dataloaders import createIdLoader
+
+from src.DBDefinitions import BaseModel
+from src.Dataloaders import createLoadersContext
+
+
+def createLoadersPerRequest(asyncSessionMaker):
+    """Puvodni createLoaders, trida je generovana pri kazdem volani"""
+    def createLambda(loaderName, DBModel):
+        return lambda self: createIdLoader(asyncSessionMaker, DBModel)
+
+    attrs = {}
+    for DBModel in BaseModel.registry.mappers:
+        cls = DBModel.class_
+        attrs[cls.__tablename__] = property(cache(createLambda(asyncSessionMaker, cls)))
+        attrs[cls.__name__] = attrs[cls.__tablename__]
+    Loaders = type('Loaders', (), attrs)
+    return Loaders()
+
+
+class Request:
+    scope = {"user": {"id": "2d9dc5ca-a4a2-11ed-b9df-0242ac120003"}}
+
+
+def before(asyncSessionMaker):
+    result = {"loaders": createLoadersPerRequest(asyncSessionMaker)}
+    result["request"] = Request()
+    logging.info(f"context created {result}")
+    result["loaders"].PublicationModel
+    return result
+
+
+def after(asyncSessionMaker):
+    result = {**createLoadersContext(asyncSessionMaker)}
+    result["request"] = Request()
+    logging.debug("context created %s", result)
+    result["loaders"].PublicationModel
+    return result
+
+
+async def main(number=20000):
+    # logovani jde do pameti, merime formatovani, ne zapis na konzoli
+    logging.basicConfig(level=logging.INFO, stream=io.StringIO(), force=True)
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    asyncSessionMaker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    for name, func in [("before", before), ("after", after)]:
+        best = min(timeit.repeat(lambda: func(asyncSessionMaker), number=number, repeat=5))
+        print(f"{name:>6}: {best / number * 1e6:8.2f} us per request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
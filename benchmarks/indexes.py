@@ -0,0 +1,121 @@
+"""Benchmark - plany a latence dotazu pred a po pridani slozenych a castecnych indexu.
+
+Na syntetickych datech (sqlite soubor) meri dotazy
+    - autori publikace serazeni podle poradi          (publication_id, "order")
+    - publikace typu serazene podle data              (publication_type_id, published_date)
+    - platna autorstvi uzivatele                      (user_id) WHERE valid = true
+nejdrive bez novych indexu, pak po jejich vytvoreni pomoci ensureIndexes.
+
+    python -m benchmarks.indexes [pocet publikaci]
+"""
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import select, insert, text
+
+from src.DBDefinitions import startEngine, ensureIndexes, PublicationModel, AuthorModel
+
+NEWINDEXES = [
+    "ix_publication_authors_publication_id_order",
+    "ix_publications_publication_type_id_published_date",
+    "ix_publication_authors_user_id_valid",
+]
+
+
+async def fill(asyncSessionMaker, publicationCount, authorsPerPublication=5, batchSize=5000):
+    rnd = random.Random(42)
+    typeIds = [uuid.uuid4() for _ in range(20)]
+    userIds = [uuid.uuid4() for _ in range(publicationCount // 10 + 1)]
+    start = datetime.datetime(2000, 1, 1)
+
+    publications = []
+    authors = []
+    for _ in range(publicationCount):
+        publicationId = uuid.uuid4()
+        publications.append({
+            "id": publicationId,
+            "name": f"publication {publicationId}",
+            "publication_type_id": rnd.choice(typeIds),
+            "published_date": start + datetime.timedelta(days=rnd.randrange(9000)),
+            "valid": True,
+        })
+        for order in range(1, authorsPerPublication + 1):
+            authors.append({
+                "id": uuid.uuid4(),
+                "publication_id": publicationId,
+                "user_id": rnd.choice(userIds),
+                "order": order,
+                "share": 1 / authorsPerPublication,
+                "valid": rnd.random() < 0.8,
+            })
+
+    async with asyncSessionMaker() as session:
+        for DBModel, rows in [(PublicationModel, publications), (AuthorModel, authors)]:
+            for index in range(0, len(rows), batchSize):
+                await session.execute(insert(DBModel), rows[index:index + batchSize])
+        await session.commit()
+        await session.execute(text("ANALYZE"))
+    return typeIds, userIds, [row["id"] for row in publications]
+
+
+def createQueries(typeIds, userIds, publicationIds):
+    return {
+        "authors of publication": (
+            lambda value: select(AuthorModel).where(AuthorModel.publication_id == value).order_by(AuthorModel.order),
+            publicationIds),
+        "publications of type": (
+            lambda value: (
+                select(PublicationModel).where(PublicationModel.publication_type_id == value)
+                .order_by(PublicationModel.published_date).limit(50)),
+            typeIds),
+        "valid authorships of user": (
+            lambda value: select(AuthorModel).where(AuthorModel.user_id == value).where(AuthorModel.valid == True),
+            userIds),
+    }
+
+
+async def measure(asyncSessionMaker, queries, repeat=300):
+    rnd = random.Random(7)
+    async with asyncSessionMaker() as session:
+        for name, (createStatement, values) in queries.items():
+            statement = createStatement(values[0])
+            compiled = statement.compile(session.bind, compile_kwargs={"literal_binds": True})
+            plan = await session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+            plan = "; ".join(row[-1] for row in plan)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rows = await session.execute(createStatement(rnd.choice(values)))
+                rows.all()
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"    {name:<28} {elapsed * 1e3:8.3f} ms   {plan}")
+
+
+async def main(publicationCount=50000):
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite")
+    asyncSessionMaker = await startEngine(f"sqlite+aiosqlite:///{path}", makeDrop=True, makeUp=True)
+    print(f"generating {publicationCount} publications")
+    queries = createQueries(*await fill(asyncSessionMaker, publicationCount))
+
+    async with asyncSessionMaker() as session:
+        for name in NEWINDEXES:
+            await session.execute(text(f"DROP INDEX {name}"))
+        await session.commit()
+    print("without indexes")
+    await measure(asyncSessionMaker, queries)
+
+    await ensureIndexes(asyncSessionMaker.kw["bind"])
+    async with asyncSessionMaker() as session:
+        await session.execute(text("ANALYZE"))
+    print("with indexes")
+    await measure(asyncSessionMaker, queries)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
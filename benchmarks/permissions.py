@@ -0,0 +1,76 @@
+"""Mikro benchmark - rezie OnlyForAuthentized na jedno pole.
+
+Stranka 100 publikaci s 8 chranenymi poli znamena 800 kontrol v jedne operaci.
+Porovnava puvodni kontrolu (DEMO z prostredi, typ pole a uzivatel z kontextu pri kazdem poli)
+s rozhodnutim spocitanym jednou pro operaci (src.GraphTypeDefinitions._GraphPermissions.OnlyForAuthentized).
+
+    python -m benchmarks.permissions
+"""
+import asyncio
+import os
+import time
+from functools import cached_property
+
+import strawberry
+from strawberry.type import StrawberryList
+
+from src.Dataloaders import getUserFromInfo
+from src.GraphTypeDefinitions.Others import PublicationGQLModel
+from src.GraphTypeDefinitions._GraphPermissions import OnlyForAuthentized
+
+
+class OriginalOnlyForAuthentized(strawberry.permission.BasePermission):
+    """Puvodni OnlyForAuthentized"""
+    message = "User is not authenticated"
+
+    async def has_permission(self, source, info, **kwargs) -> bool:
+        if self.isDEMO:
+            print("DEMO Enabled, not for production")
+            return True
+
+        self.defaultResult = [] if info._field.type.__class__ == StrawberryList else None
+        user = getUserFromInfo(info)
+        return (False if user is None else True)
+
+    @cached_property
+    def isDEMO(self):
+        DEMO = os.getenv("DEMO", None)
+        return DEMO == "True"
+
+
+class Request:
+    scope = {"user": {"id": "2d9dc5ca-a4a2-11ed-b9df-0242ac120003"}}
+
+
+class Info:
+    def __init__(self, context, field):
+        self.context = context
+        self._field = field
+
+
+async def operation(permissionClass, fields, rows=100):
+    """Jedna operace - kontrola vsech poli vsech radku stranky, strawberry vytvari instanci opravneni pro kazde pole"""
+    context = {"request": Request()}
+    infos = [Info(context, field) for field in fields]
+    for _ in range(rows):
+        for info in infos:
+            assert await permissionClass().has_permission(None, info)
+
+
+async def main(operations=200):
+    os.environ["DEMO"] = "False"
+    fields = PublicationGQLModel.__strawberry_definition__.fields[:8]
+    checks = operations * 100 * len(fields)
+    for name, permissionClass in [("before", OriginalOnlyForAuthentized), ("after", OnlyForAuthentized)]:
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(operations):
+                await operation(permissionClass, fields)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>6}: {best / checks * 1e6:8.3f} us per field check, {best / operations * 1e3:8.3f} ms per operation")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
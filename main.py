@@ -1,16 +1,21 @@
 import os
+import asyncio
 from contextlib import asynccontextmanager
 import socket
 import logging
 import logging.handlers
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from strawberry.asgi import GraphQL
 
-from uoishelpers.gqlrouter import MountGuardedGQL
+from uoishelpers.gqlrouter import MountGuardedGQL, defaultSentinel, Item
 
-from src.DBDefinitions import startEngine, ComposeConnectionString
+from src.DBDefinitions import startEngine, ComposeConnectionString, ComposeEngineOptions, ComposeReplicaConnectionString
+from src.DBDefinitions import initializationLock, warmUpPool, pingDatabase
+from src.DBMetrics import createMetricsApp
 from src.DBFeeder import initDB
-from src.Dataloaders import createLoaders
+from src.DBExport import exportPublications
+from src.Dataloaders import createLoadersContext, lookupTables, closeUGSession
 from src.GraphTypeDefinitions import schema
 
 
@@ -33,18 +38,29 @@ if SYSLOGHOST is not None:
 # from gql_workflow.DBFeeder import createSystemDataStructureRoleTypes, createSystemDataStructureGroupTypes
 
 connectionString = ComposeConnectionString()
+replicaConnectionString = ComposeReplicaConnectionString()
 
 
 def singleCall(asyncFunc):
     """Dekorator, ktery dovoli, aby dekorovana funkce byla volana (vycislena) jen jednou. Navratova hodnota je zapamatovana a pri dalsich volanich vracena.
-    Dekorovana funkce je asynchronni.
+    Dekorovana funkce je asynchronni. Volani, ktera prijdou pred dokoncenim prvniho, cekaji na tentyz beh (single-flight),
+    skonci-li beh vyjimkou (nebo je zrusen), dalsi volani jej spusti znovu.
+    Zruseni cekajiciho volani beh neprerusi (asyncio.shield), ostatni volani na nej dal cekaji.
     """
     resultCache = {}
 
     async def result():
-        if resultCache.get("result", None) is None:
-            resultCache["result"] = await asyncFunc()
-        return resultCache["result"]
+        task = resultCache.get("task", None)
+        if task is None:
+            task = asyncio.ensure_future(asyncFunc())
+            resultCache["task"] = task
+        try:
+            return await asyncio.shield(task)
+        except BaseException:
+            failed = task.done() and (task.cancelled() or task.exception() is not None)
+            if failed and resultCache.get("task", None) is task:
+                del resultCache["task"]
+            raise
 
     return result
 
@@ -57,17 +73,21 @@ async def RunOnceAndReturnSessionMaker():
 
     import os
     makeDrop = os.environ.get("DEMO", "") == "True"
-    result = await startEngine(
-        connectionstring=connectionString, makeDrop=makeDrop, makeUp=True
-    )
-
-    print(f"initializing system structures")
-
-    ###########################################################################################################################
-    #
-    # zde definujte do funkce asyncio.gather
-    # vlozte asynchronni funkce, ktere maji data uvest do prvotniho konzistentniho stavu
-    await initDB(result)
+    # schema a inicializacni data jsou jinak preskocena, pokud se od minuleho startu nezmenila
+    force = os.environ.get("DBINIT_FORCE", "False") in ["True", "true"]
+    # jen jeden proces (gunicorn worker) inicializuje databazi, ostatni pockaji
+    async with initializationLock(connectionString):
+        result = await startEngine(
+            connectionstring=connectionString, makeDrop=makeDrop, makeUp=True, engineOptions=ComposeEngineOptions(), force=force
+        )
+
+        print(f"initializing system structures")
+
+        ###########################################################################################################################
+        #
+        # zde definujte do funkce asyncio.gather
+        # vlozte asynchronni funkce, ktere maji data uvest do prvotniho konzistentniho stavu
+        await initDB(result, force=force)
     # await asyncio.gather( # concurency running :)
     # sem lze dat vsechny funkce, ktere maji nejak inicializovat databazi
     # musi byt asynchronniho typu (async def ...)
@@ -79,12 +99,25 @@ async def RunOnceAndReturnSessionMaker():
     print(f"all done")
     return result
 
+@singleCall
+async def RunOnceAndReturnReplicaSessionMaker():
+    """Vraci asynchronni SessionMaker repliky (jen pro cteni, schema ani data nezaklada).
+    Neni-li replika nastavena, vraci primarni SessionMaker.
+    """
+    if replicaConnectionString is None:
+        return await RunOnceAndReturnSessionMaker()
+    print(f'starting replica engine for "{replicaConnectionString}"')
+    return await startEngine(
+        connectionstring=replicaConnectionString, makeDrop=False, makeUp=False, engineOptions=ComposeEngineOptions(),
+        poolName="replica"
+    )
+
 async def get_context(request: Request):
     asyncSessionMaker = await RunOnceAndReturnSessionMaker()
+    readAsyncSessionMaker = await RunOnceAndReturnReplicaSessionMaker()
         
     #from src.Dataloaders import createLoadersContext, createUgConnectionContext
-    from src.Dataloaders import createLoadersContext
-    context = createLoadersContext(asyncSessionMaker)
+    context = createLoadersContext(asyncSessionMaker, readAsyncSessionMaker)
     # i = Item(query = "")
     # # i.query = ""
     # # i.variables = {}
@@ -96,19 +129,78 @@ async def get_context(request: Request):
     result = {**context}
     result["request"] = request
     # result["user"] = request.scope.get("user", None)
-    logging.info(f"context created {result}")
+    logging.debug("context created %s", result)
     return result
 
+readiness = {"ready": False}
+
+@singleCall
+async def RunOnceAndWarmUp():
+    """Inicializace a zahrati procesu (spojeni v poolu, ciselniky), pak je proces pripraven (/health/ready)"""
+    initizalizedEngine = await RunOnceAndReturnSessionMaker()
+    replicaEngine = await RunOnceAndReturnReplicaSessionMaker()
+    warmUpConnections = ComposeEngineOptions().get("pool_size", 5)
+    for asyncSessionMaker in {initizalizedEngine, replicaEngine}:
+        await warmUpPool(asyncSessionMaker, warmUpConnections)
+        await lookupTables.preload(asyncSessionMaker)
+    readiness["ready"] = True
+    return readiness
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    initizalizedEngine = await RunOnceAndReturnSessionMaker()
+    await RunOnceAndWarmUp()
     yield
+    await closeUGSession()
 
 app = FastAPI(lifespan=lifespan)
 
 DEMO = os.getenv("DEMO", None)
 MountGuardedGQL(app, schema=schema, get_context=get_context, DEMO=os.getenv("DEMO", None))
 
+app.mount("/metrics", createMetricsApp())
+
+@app.get("/health/live")
+async def health_live():
+    """Proces bezi"""
+    return {"status": "live"}
+
+HEALTH_PING_TIMEOUT = float(os.getenv("HEALTH_PING_TIMEOUT", "2"))
+
+@app.get("/health/ready")
+async def health_ready():
+    """Proces je inicializovan a databaze odpovida, vraci dobu odezvy databaze"""
+    if not readiness["ready"]:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    result = {"status": "ready"}
+    databases = {"db": await RunOnceAndReturnSessionMaker(), "replica": await RunOnceAndReturnReplicaSessionMaker()}
+    if databases["replica"] is databases["db"]:
+        del databases["replica"]
+    for name, asyncSessionMaker in databases.items():
+        try:
+            latency = await asyncio.wait_for(pingDatabase(asyncSessionMaker), timeout=HEALTH_PING_TIMEOUT)
+        except Exception as e:
+            logging.warning(f"readiness check of {name} failed {e}")
+            return JSONResponse({"status": "unavailable", "database": name}, status_code=503)
+        result[f"{name}_ping_ms"] = round(latency * 1000, 3)
+    return result
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+@app.get("/export/publications")
+async def export_publications(request: Request, format: str = "ndjson", authors: bool = False):
+    """Streamuje vsechny publikace (s authors=true radek na kazde autorstvi) jako NDJSON nebo CSV"""
+    if format not in ["ndjson", "csv"]:
+        return JSONResponse({"errors": [f"unknown format {format}, use ndjson or csv"]}, status_code=400)
+    if os.getenv("DEMO", None) not in ["True", "true"]:
+        sentinelResult = await defaultSentinel(request, Item(query="export publications"))
+        if sentinelResult:
+            return sentinelResult
+
+    asyncSessionMaker = await RunOnceAndReturnReplicaSessionMaker()
+    content = exportPublications(asyncSessionMaker, format=format, withAuthors=authors, chunkSize=EXPORT_CHUNK_SIZE)
+    mediaType = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(content, media_type=mediaType)
+
 # region ENV setup tests
 def envAssertDefined(name, default=None):
     result = os.getenv(name, None)
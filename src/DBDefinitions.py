@@ -13,6 +13,7 @@ from sqlalchemy import (
     Boolean,
     Date,
     Float,
+    Index,
 
     Uuid
 )
@@ -21,6 +22,7 @@ from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
+import time
 
 BaseModel = declarative_base()
 
@@ -28,8 +30,8 @@ BaseModel = declarative_base()
 def UUIDFKey(comment=None, nullable=True, **kwargs):
     return Column(Uuid, index=True, comment=comment, nullable=nullable, **kwargs)
 
-def UUIDColumn():
-    return Column(Uuid, primary_key=True, comment="primary key", default=uuid)
+def UUIDColumn(**kwargs):
+    return Column(Uuid, primary_key=True, comment="primary key", default=uuid.uuid4, **kwargs)
 
 
 # id = Column(UUID(as_uuid=True), primary_key=True, server_default=sqlalchemy.text("uuid_generate_v4()"),)
@@ -92,6 +94,13 @@ class PublicationModel(BaseModel):
     changedby = UUIDFKey(nullable=True, comment="who's changed the entity")#Column(ForeignKey("users.id"), index=True, nullable=True)
     rbacobject = UUIDFKey(nullable=True, comment="user or group id, determines access")
 
+    __table_args__ = (
+        # keyset (cursor) strankovani, viz createCursorPageResolver
+        Index("ix_publications_lastchange_id", "lastchange", "id"),
+        # publikace daneho typu serazene podle data
+        Index("ix_publications_publication_type_id_published_date", "publication_type_id", "published_date"),
+    )
+
 class AuthorModel(BaseModel):
     __tablename__ = "publication_authors"
 
@@ -112,6 +121,17 @@ class AuthorModel(BaseModel):
     changedby = UUIDFKey(nullable=True)#Column(ForeignKey("users.id"), index=True, nullable=True)
     rbacobject = UUIDFKey(nullable=True, comment="user or group id, determines access")
 
+    __table_args__ = (
+        # keyset (cursor) strankovani, viz createCursorPageResolver
+        Index("ix_publication_authors_lastchange_id", "lastchange", "id"),
+        # autori publikace serazeni podle poradi (fkey loader, presun autora)
+        Index("ix_publication_authors_publication_id_order", "publication_id", "order"),
+        # platna autorstvi uzivatele
+        Index(
+            "ix_publication_authors_user_id_valid", user_id,
+            postgresql_where=(valid == True), sqlite_where=(valid == True)),
+    )
+
 class PublicationTypeModel(BaseModel):
     __tablename__ = "publicationtypes"
 
@@ -151,15 +171,140 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 
 
-async def startEngine(connectionstring, makeDrop=False, makeUp=True):
-    """Provede nezbytne ukony a vrati asynchronni SessionMaker"""
-    asyncEngine = create_async_engine(connectionstring)
+INVALIDINDEXESSTATEMENT = sqlalchemy.text("""
+    SELECT c.relname FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE NOT i.indisvalid AND n.nspname = current_schema()
+""")
 
+def dropInvalidIndexes(connection, names=None):
+    """Postgres - preruseny nebo neuspesny CREATE INDEX CONCURRENTLY zanecha index ve stavu INVALID,
+    ktery se nepouziva, ale jeho jmeno existuje (IF NOT EXISTS / inspektor jej povazuji za vytvoreny).
+    Takove indexy (jen jmena z names, je-li dano) zahodi, aby mohly byt vytvoreny znovu. Vraci jejich jmena.
+    Volat na spojeni v rezimu AUTOCOMMIT (DROP INDEX CONCURRENTLY nelze v transakci).
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    invalid = [name for name in connection.execute(INVALIDINDEXESSTATEMENT).scalars() if names is None or name in names]
+    preparer = connection.dialect.identifier_preparer
+    for name in invalid:
+        connection.execute(sqlalchemy.text(f"DROP INDEX CONCURRENTLY IF EXISTS {preparer.quote(name)}"))
+    if len(invalid) > 0:
+        print(f"invalid indexes dropped {invalid}")
+    return invalid
+
+async def ensureIndexes(asyncEngine):
+    """Vytvori indexy z modelu, ktere v databazi chybi. create_all existujici tabulky preskakuje
+    i s jejich indexy, nove indexy by se tak do bezici databaze nedostaly.
+    Na postgresu jsou indexy vytvareny CONCURRENTLY (mimo transakci), tj. bez blokovani zapisu do tabulky,
+    neplatne (INVALID) indexy po predchozim nedokoncenem vytvareni jsou zahozeny a vytvoreny znovu.
+    """
+    concurrently = asyncEngine.dialect.name == "postgresql"
+
+    def createMissing(connection):
+        modelIndexes = {index.name for table in BaseModel.metadata.sorted_tables for index in table.indexes}
+        invalid = set(dropInvalidIndexes(connection, modelIndexes))
+        inspector = sqlalchemy.inspect(connection)
+        existingTables = set(inspector.get_table_names())
+        created = []
+        for table in BaseModel.metadata.sorted_tables:
+            if table.name not in existingTables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}.difference(invalid)
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                options = index.dialect_options["postgresql"]
+                previous = options["concurrently"]
+                options["concurrently"] = concurrently
+                try:
+                    index.create(connection)
+                finally:
+                    options["concurrently"] = previous
+                created.append(index.name)
+        return created
+
+    async with asyncEngine.connect() as conn:
+        if concurrently:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        created = await conn.run_sync(createMissing)
+        await conn.commit()
+    if len(created) > 0:
+        print(f"indexes created {created}")
+    return created
+
+
+import hashlib
+import contextlib
+from sqlalchemy.pool import NullPool
+
+# klic advisory locku inicializace, stejny pro vsechny procesy sluzby
+INITIALIZATIONLOCKKEY = int.from_bytes(hashlib.sha256(b"gql_publications initialization").digest()[:8], "big", signed=True)
+
+@contextlib.asynccontextmanager
+async def initializationLock(connectionstring, key=INITIALIZATIONLOCKKEY):
+    """Meziprocesovy zamek inicializace databaze (postgres advisory lock na samostatnem spojeni),
+    inicializaci (create_all, import dat) tak provadi jen jeden proces, ostatni cekaji a pak zjisti,
+    ze je vse hotovo (viz DBFingerprint). Pro ostatni databaze nedela nic.
+    """
+    if sqlalchemy.engine.make_url(connectionstring).get_backend_name() != "postgresql":
+        yield
+        return
+    lockEngine = create_async_engine(connectionstring, poolclass=NullPool)
+    try:
+        async with lockEngine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(sqlalchemy.text("SELECT pg_advisory_lock(:key)"), {"key": key})
+            try:
+                yield
+            finally:
+                await conn.execute(sqlalchemy.text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+    finally:
+        await lockEngine.dispose()
+
+async def pingDatabase(asyncSessionMaker):
+    """Vraci dobu (s) dotazu SELECT 1 vcetne ziskani spojeni z poolu"""
+    start = time.perf_counter()
+    async with asyncSessionMaker() as session:
+        await session.execute(sqlalchemy.text("SELECT 1"))
+    return time.perf_counter() - start
+
+async def warmUpPool(asyncSessionMaker, connections=5):
+    """Otevre soucasne connections spojeni, pool je tak ma pripravena pro prvni pozadavky"""
+    async with contextlib.AsyncExitStack() as stack:
+        sessions = [await stack.enter_async_context(asyncSessionMaker()) for _ in range(connections)]
+        for session in sessions:
+            await session.execute(sqlalchemy.text("SELECT 1"))
+
+
+async def startEngine(connectionstring, makeDrop=False, makeUp=True, engineOptions={}, force=False, poolName="primary"):
+    """Provede nezbytne ukony a vrati asynchronni SessionMaker
+    engineOptions jsou predany create_async_engine (viz ComposeEngineOptions)
+    poolName je label metrik poolu (primary, replica)
+    Odpovida-li otisk schematu ulozeny v databazi modelu, create_all a dalsi ukony jsou preskoceny,
+    force=True je provede vzdy.
+    """
+    from .DBMetrics import InstrumentedAsyncAdaptedQueuePool, instrumentEngine
+    from .DBFingerprint import schemaFingerprint, readFingerprints, writeFingerprints, clearFingerprints
+    engineOptions = {**engineOptions}
+    engineOptions.setdefault("pool_logging_name", poolName)
+    if sqlalchemy.engine.make_url(connectionstring).get_backend_name() != "sqlite":
+        # sqlite ma vlastni pooly (StaticPool pro :memory:)
+        engineOptions.setdefault("poolclass", InstrumentedAsyncAdaptedQueuePool)
+    asyncEngine = instrumentEngine(create_async_engine(connectionstring, **engineOptions))
+
+    fingerprint = schemaFingerprint(asyncEngine.dialect)
+    upToDate = False
     async with asyncEngine.begin() as conn:
         if makeDrop:
             await conn.run_sync(BaseModel.metadata.drop_all)
+            await clearFingerprints(conn)
             print("BaseModel.metadata.drop_all finished")
         if makeUp:
+            fingerprints = await readFingerprints(conn)
+            upToDate = not force and fingerprints.get("schema", None) == fingerprint
+        if makeUp and not upToDate:
             try:
                 await conn.run_sync(BaseModel.metadata.create_all)
                 print("BaseModel.metadata.create_all finished")
@@ -167,6 +312,14 @@ async def startEngine(connectionstring, makeDrop=False, makeUp=True):
                 print(e)
                 print("Unable automaticaly create tables")
                 return None
+    if makeUp and upToDate:
+        print("schema fingerprint matches, create_all skipped")
+    if makeUp and not upToDate:
+        from .DBSearch import ensureSearch
+        await ensureIndexes(asyncEngine)
+        await ensureSearch(asyncEngine)
+        async with asyncEngine.begin() as conn:
+            await writeFingerprints(conn, {"schema": fingerprint})
 
     async_sessionMaker = sessionmaker(
         asyncEngine, expire_on_commit=False, class_=AsyncSession
@@ -191,3 +344,41 @@ def ComposeConnectionString():
     connectionstring = f"{driver}://{user}:{password}@{hostWithPort}/{database}"
     connectionstring = os.environ.get("CONNECTIONSTRING", connectionstring)
     return connectionstring
+
+
+def ComposeEngineOptions():
+    """Odvozuje nastaveni poolu spojeni z promennych prostredi, nezadane hodnoty necha na vychozich
+    hodnotach SQLAlchemy.
+    POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT (s, cekani na spojeni), POOL_RECYCLE (s), POOL_PRE_PING (True/False)
+    """
+    conversions = {
+        "POOL_SIZE": ("pool_size", int),
+        "POOL_MAX_OVERFLOW": ("max_overflow", int),
+        "POOL_TIMEOUT": ("pool_timeout", float),
+        "POOL_RECYCLE": ("pool_recycle", int),
+        "POOL_PRE_PING": ("pool_pre_ping", lambda value: value in ["True", "true", "1"]),
+    }
+    result = {}
+    for envName, (optionName, convert) in conversions.items():
+        value = os.environ.get(envName, None)
+        if value is not None:
+            result[optionName] = convert(value)
+    return result
+
+
+def ComposeReplicaConnectionString():
+    """Odvozuje connectionString repliky urcene jen pro cteni, neni-li replika nastavena, vraci None.
+    Bere CONNECTIONSTRING_REPLICA, nebo POSTGRES_REPLICA_HOST (ostatni udaje jako ComposeConnectionString).
+    """
+    connectionstring = os.environ.get("CONNECTIONSTRING_REPLICA", None)
+    if connectionstring is not None:
+        return connectionstring
+    hostWithPort = os.environ.get("POSTGRES_REPLICA_HOST", None)
+    if hostWithPort is None:
+        return None
+
+    user = os.environ.get("POSTGRES_USER", "postgres")
+    password = os.environ.get("POSTGRES_PASSWORD", "example")
+    database = os.environ.get("POSTGRES_DB", "data")
+    driver = "postgresql+asyncpg"
+    return f"{driver}://{user}:{password}@{hostWithPort}/{database}"
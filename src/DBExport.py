@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import datetime
+import uuid
+
+from sqlalchemy import select
+
+from src.DBDefinitions import PublicationModel, AuthorModel
+
+###########################################################################################################################
+#
+# export publikaci (a autorstvi) po castech
+# kazda cast je nactena samostatnym kratkym dotazem (keyset podle publications.id), spojeni s databazi
+# tak neni drzeno po celou dobu exportu a pamet je omezena velikosti casti
+#
+###########################################################################################################################
+
+def exportColumnNames(withAuthors=False):
+    names = [column.key for column in PublicationModel.__table__.columns]
+    if withAuthors:
+        names.extend(f"author_{column.key}" for column in AuthorModel.__table__.columns)
+    return names
+
+async def readPublicationChunks(asyncSessionMaker, withAuthors=False, chunkSize=1000):
+    """Asynchronni generator, vraci radky exportu (slovniky) po castech.
+    Jedna cast obsahuje nejvyse chunkSize publikaci, s withAuthors je kazda publikace
+    spojena (outer join) se svymi autory, tj. vraci jeden radek na autorstvi.
+    """
+    columns = list(PublicationModel.__table__.columns)
+    if withAuthors:
+        columns.extend(column.label(f"author_{column.key}") for column in AuthorModel.__table__.columns)
+
+    lastId = None
+    while True:
+        chunk = select(PublicationModel.id).order_by(PublicationModel.id).limit(chunkSize)
+        if lastId is not None:
+            chunk = chunk.where(PublicationModel.id > lastId)
+        chunk = chunk.subquery()
+
+        statement = (
+            select(*columns)
+            .select_from(PublicationModel)
+            .join(chunk, chunk.c.id == PublicationModel.id)
+        )
+        if withAuthors:
+            statement = (
+                statement
+                .outerjoin(AuthorModel, AuthorModel.publication_id == PublicationModel.id)
+                .order_by(PublicationModel.id, AuthorModel.order)
+            )
+        else:
+            statement = statement.order_by(PublicationModel.id)
+
+        async with asyncSessionMaker() as session:
+            rows = await session.execute(statement)
+            rows = rows.mappings().all()
+
+        if len(rows) == 0:
+            return
+        yield rows
+        lastId = rows[-1]["id"]
+
+def exportValue(value):
+    if isinstance(value, uuid.UUID):
+        return f"{value}"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+async def exportNDJSON(chunks):
+    """Prevadi casti na NDJSON, jeden json objekt na radek"""
+    async for rows in chunks:
+        yield "".join(
+            json.dumps({key: exportValue(value) for key, value in row.items()}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+async def exportCSV(chunks, columnNames):
+    """Prevadi casti na CSV, prvni radek je hlavicka"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columnNames)
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows({key: exportValue(value) for key, value in row.items()} for row in rows)
+        yield buffer.getvalue()
+
+def exportPublications(asyncSessionMaker, format="ndjson", withAuthors=False, chunkSize=1000):
+    """Vraci asynchronni generator textu exportu publikaci ve formatu ndjson nebo csv"""
+    assert format in ["ndjson", "csv"], f"unknown export format {format}"
+    chunks = readPublicationChunks(asyncSessionMaker, withAuthors=withAuthors, chunkSize=chunkSize)
+    if format == "csv":
+        return exportCSV(chunks, exportColumnNames(withAuthors))
+    return exportNDJSON(chunks)
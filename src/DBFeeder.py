@@ -13,6 +13,7 @@ from functools import cache
 
 
 from sqlalchemy.future import select
+from sqlalchemy import insert
 
 
 def singleCall(asyncFunc):
@@ -81,79 +82,42 @@ async def predefineAllDataStructures(asyncSessionMaker):
 
 
 async def putPredefinedStructuresIntoTable(
-    asyncSessionMaker, DBModel, structureFunction
+    asyncSessionMaker, DBModel, structureFunction, batchSize=1000
 ):
     """Zabezpeci prvotni inicicalizaci typu externích ids v databazi
     DBModel zprostredkovava tabulku, je to sqlalchemy model
     structureFunction() dava data, ktera maji byt ulozena
+    Do databaze jsou posilana jen id ocekavanych radku (po davkach), ulozeny jsou jen chybejici radky,
+    existujici radky nejsou meneny. Vraci souhrn {"table", "expected", "present", "inserted"}
     """
-    # ocekavane typy
-    externalIdTypes = structureFunction()
+    from src.DBSeeder import groupRows
 
-    # dotaz do databaze
-    stmt = select(DBModel)
-    async with asyncSessionMaker() as session:
-        dbSet = await session.execute(stmt)
-        dbRows = list(dbSet.scalars())
-
-    # extrakce dat z vysledku dotazu
-    # vezmeme si jen atributy name a id, id je typu uuid, tak jej zkovertujeme na string
-    dbRowsDicts = [{"name": row.name, "id": f"{row.id}"} for row in dbRows]
-
-    print(structureFunction, "external id types found in database")
-    print(dbRowsDicts)
-
-    # vytahneme si vektor (list) id, ten pouzijeme pro operator in nize
-    idsInDatabase = [row["id"] for row in dbRowsDicts]
-
-    # zjistime, ktera id nejsou v databazi
-    unsavedRows = list(
-        filter(lambda row: not (row["id"] in idsInDatabase), externalIdTypes)
-    )
-    print(structureFunction, "external id types not found in database")
-    print(unsavedRows)
+    convert = createRowConverter(DBModel)
+    expectedRows = [convert(dict(row)) for row in structureFunction()]
 
-    # pro vsechna neulozena id vytvorime entity
-    rowsToAdd = [DBModel(**row) for row in unsavedRows]
-    print(rowsToAdd)
-    print(len(rowsToAdd))
-
-    # a vytvorene entity jednou operaci vlozime do databaze
     async with asyncSessionMaker() as session:
-        async with session.begin():
-            session.add_all(rowsToAdd)
+        # databaze vrati, ktera z ocekavanych id uz ma
+        idsInDatabase = set()
+        for index in range(0, len(expectedRows), batchSize):
+            ids = [row["id"] for row in expectedRows[index:index + batchSize]]
+            rows = await session.execute(select(DBModel.id).where(DBModel.id.in_(ids)))
+            idsInDatabase.update(rows.scalars())
+
+        unsavedRows = [row for row in expectedRows if row["id"] not in idsInDatabase]
+        # poradi ukladani (_chunk) zachovano, radky se stejnymi sloupci jednim prikazem
+        for columnNames, rows in groupRows(DBModel, unsavedRows):
+            for index in range(0, len(rows), batchSize):
+                await session.execute(insert(DBModel), rows[index:index + batchSize])
         await session.commit()
 
-    # jeste jednou se dotazeme do databaze
-    stmt = select(DBModel)
-    async with asyncSessionMaker() as session:
-        dbSet = await session.execute(stmt)
-        dbRows = dbSet.scalars()
-
-    # extrakce dat z vysledku dotazu
-    dbRowsDicts = [{"name": row.name, "id": f"{row.id}"} for row in dbRows]
-
-    print(structureFunction, "found in database")
-    print(dbRowsDicts)
-
-    # znovu id, ktera jsou uz ulozena
-    idsInDatabase = [row["id"] for row in dbRowsDicts]
-
-    # znovu zaznamy, ktere dosud ulozeny nejsou, mely by byt ulozeny vsechny, takze prazdny list
-    unsavedRows = list(
-        filter(lambda row: not (row["id"] in idsInDatabase), externalIdTypes)
-    )
-
-    # ted by melo byt pole prazdne
-    print(structureFunction, "not found in database")
-    print(unsavedRows)
-    if not (len(unsavedRows) == 0):
-        print("SOMETHING is REALLY WRONG")
-
-    print(structureFunction, "Defined in database")
-    # nyni vsechny entity mame v pameti a v databazi synchronizovane
-    print(structureFunction())
-    pass
+    summary = {
+        "table": DBModel.__tablename__,
+        "expected": len(expectedRows),
+        "present": len(expectedRows) - len(unsavedRows),
+        "inserted": len(unsavedRows),
+    }
+    print("predefined structures", summary)
+    return summary
 
 
 from src.DBDefinitions import (
@@ -163,27 +127,34 @@ from src.DBDefinitions import (
     PublicationTypeModel,
 )
 
-limit = 10
 import uuid
+import datetime
+import json
+from src.DBSeeder import upsertRows
 
+###########################################################################################################################
+#
+# synteticka data pro testy vykonu (10^5 - 10^7 radku)
+# kazdy radek ma vlastni generator nahodnych cisel odvozeny od seed, druhu a poradi radku,
+# data jsou tak pro stejne parametry vzdy stejna a lze je generovat po tabulkach bez drzeni v pameti
+#
+###########################################################################################################################
 
-def randomUUID():
-    userIDs = [uuid.uuid4() for _ in range(limit)]
-    return userIDs
 
+def syntheticId(seed, kind, index):
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"{seed}:{kind}:{index}")
 
-def randomAuthor(id):
-    return {
-        "id": id,
-        "user_id": random.choice(authorIDs),
-        "publication_id": random.choice(publicationIDs),
-        "order": randomOrder(),
-        "share": randomShare(),
-        "externalId": "",
-    }
+
+def syntheticRandom(seed, kind, index):
+    return random.Random(f"{seed}:{kind}:{index}")
+
+
+def createZipfWeights(count, skew):
+    """Kumulativni vahy pro rnd.choices, k-ty prvek ma vahu 1 / k^skew (nekolik oblibenych, dlouhy chvost)"""
+    return list(itertools.accumulate(1 / (k ** skew) for k in range(1, count + 1)))
 
 
-def randomPublicationName():
+def randomPublicationName(rnd):
     publicationNames = [
         "Database systems",
         "Data Mining",
@@ -192,115 +163,178 @@ def randomPublicationName():
         "Zaklady siti",
         "Telekomunikacni technika",
     ]
-    return random.choice(publicationNames)
+    return f"{rnd.choice(publicationNames)} {rnd.randrange(1, 1000)}"
 
 
-def randomReference():
-
+def randomReference(rnd):
     return "Monografie: FINKE, Manfred. Sulzbach im 17. Jahrhundert : zur Kulturgeschichte einer süddeutschen Residenz. Regensburg : Friedrich Pustet, 1998. 404 s. ISBN 3-7917-1596-8."
 
 
-def randomPlace():
+def randomPlace(rnd):
     places = ["Brno", "Praha", "Ostrava", "Plzen", "Olomouc"]
-    return random.choice(places)
-
-
-def randomPublishedDate():
-    defualt_date = date(2015, 6, 3)
-    return defualt_date + timedelta(days=random.randint(1, 100))
-
-
-def randomShare():
-    return int(100 / (random.randint(1, 4)))
-
-
-def randomOrder():
-    return random.randint(1, 2)
-
-
-def randomPublicationTypes(ids):
-    types = [
-        "Skripta",
-        "Clanek v odbornem periodiku",
-        "Konferencni prispevek",
-        "Clanek",
-        "Recenze",
-    ]
-
-    return [{"id": id, "type": type} for id, type in zip(ids, types)]
-
-
-def randomPublications(id):
-    return {
-        "id": id,
-        "name": randomPublicationName(),
-        "publication_type_id": random.choice(publicationTypesIds),
-        "place": randomPlace(),
-        "published_date": randomPublishedDate(),
-        "reference": randomReference(),
-        "valid": True,
-        "externalId": "",
-    }
-
-
-from sqlalchemy.future import select
-
-
-def createDataStructurePublications():
-    publications = [randomPublications(id) for id in publicationIDs]
-    return publications
-
-
-def createDataStructureAuthors():
-    authors = [randomAuthor(id) for id in authorIDs]
-    return authors
-
-
-def createDataStructurePublicationTypes():
-    publicationsTypes = randomPublicationTypes(publicationTypesIds)
-    return publicationsTypes
-
-
-userIDs = randomUUID()
-authorIDs = randomUUID()
-publicationIDs = randomUUID()
-publicationTypesIds = randomUUID()
-
-
-# with open('publications_dataset.json', 'w') as outfile:
-#     json.dump(dataset, outfile,cls=UUIDEncoder)
-
-from sqlalchemy.future import select
-
-
-async def randomDataStructure(session):
-
-    publication_types = createDataStructurePublicationTypes()
-    publicationsTypesToAdd = [
-        PublicationTypeModel(**record) for record in publication_types
-    ]
-
-    async with session.begin():
-        session.add_all(publicationsTypesToAdd)
-    await session.commit()
+    return rnd.choice(places)
+
+
+def randomPublishedDate(rnd, startDate, days):
+    return startDate + datetime.timedelta(days=rnd.randrange(days))
+
+
+def randomCount(rnd, counts):
+    """Nahodny pocet dle rozdeleni counts {pocet: vaha}"""
+    return rnd.choices(list(counts.keys()), weights=list(counts.values()))[0]
+
+
+def batched(DBModel, rows, batchSize):
+    """Generator, vraci (DBModel, davka radku)"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batchSize:
+            yield DBModel, batch
+            batch = []
+    if len(batch) > 0:
+        yield DBModel, batch
+
+
+def generateSyntheticData(
+    publicationCount=1000,
+    seed=42,
+    categoryCount=2,
+    typeCount=5,
+    userCount=None,
+    subjectCount=100,
+    authorCounts={1: 3, 2: 3, 3: 2, 4: 1, 5: 1},
+    subjectCounts={0: 2, 1: 2, 2: 1},
+    skew=1.1,
+    startDate=datetime.datetime(2000, 1, 1),
+    days=9000,
+    batchSize=5000,
+):
+    """Generator, vraci (DBModel, davka radku) po tabulkach v poradi zavislosti (kategorie, typy, publikace, autori, predmety).
+    authorCounts a subjectCounts jsou rozdeleni poctu autoru a predmetu publikace {pocet: vaha},
+    typy publikaci, uzivatele (autori) a predmety maji zipfovskou oblibenost danou skew.
+    """
+    if userCount is None:
+        userCount = max(publicationCount // 5, 10)
+
+    categoryIds = [syntheticId(seed, "category", index) for index in range(categoryCount)]
+    typeIds = [syntheticId(seed, "type", index) for index in range(typeCount)]
+    userIds = [syntheticId(seed, "user", index) for index in range(userCount)]
+    subjectIds = [syntheticId(seed, "subject", index) for index in range(subjectCount)]
+    typeWeights = createZipfWeights(typeCount, skew)
+    userWeights = createZipfWeights(userCount, skew)
+    subjectWeights = createZipfWeights(subjectCount, skew)
+
+    def categories():
+        for index, id in enumerate(categoryIds):
+            yield {"id": id, "name": f"Kategorie {index}", "name_en": f"Category {index}"}
+
+    def types():
+        for index, id in enumerate(typeIds):
+            yield {
+                "id": id,
+                "name": f"Typ {index}",
+                "name_en": f"Type {index}",
+                "category_id": categoryIds[index % categoryCount] if categoryCount > 0 else None,
+            }
+
+    def publications():
+        for index in range(publicationCount):
+            rnd = syntheticRandom(seed, "publication", index)
+            yield {
+                "id": syntheticId(seed, "publication", index),
+                "name": randomPublicationName(rnd),
+                "publication_type_id": rnd.choices(typeIds, cum_weights=typeWeights)[0],
+                "place": randomPlace(rnd),
+                "published_date": randomPublishedDate(rnd, startDate, days),
+                "reference": randomReference(rnd),
+                "valid": True,
+            }
+
+    def authors():
+        for index in range(publicationCount):
+            rnd = syntheticRandom(seed, "authors", index)
+            count = randomCount(rnd, authorCounts)
+            # jeden uzivatel je autorem publikace nejvyse jednou
+            users = list(dict.fromkeys(rnd.choices(userIds, cum_weights=userWeights, k=count)))
+            for order, userId in enumerate(users, start=1):
+                yield {
+                    "id": syntheticId(seed, "author", f"{index}:{order}"),
+                    "publication_id": syntheticId(seed, "publication", index),
+                    "user_id": userId,
+                    "order": order,
+                    "share": 1 / len(users),
+                    "valid": True,
+                }
+
+    def subjects():
+        for index in range(publicationCount):
+            rnd = syntheticRandom(seed, "subjects", index)
+            count = randomCount(rnd, subjectCounts)
+            for order, subjectId in enumerate(dict.fromkeys(rnd.choices(subjectIds, cum_weights=subjectWeights, k=count))):
+                yield {
+                    "id": syntheticId(seed, "publication_subject", f"{index}:{order}"),
+                    "publication_id": syntheticId(seed, "publication", index),
+                    "subject_id": subjectId,
+                    "valid": True,
+                }
+
+    yield from batched(PublicationCategoryModel, categories(), batchSize)
+    yield from batched(PublicationTypeModel, types(), batchSize)
+    yield from batched(PublicationModel, publications(), batchSize)
+    if len(userIds) > 0:
+        yield from batched(AuthorModel, authors(), batchSize)
+    if len(subjectIds) > 0:
+        yield from batched(SubjectModel, subjects(), batchSize)
+
+
+async def writeSyntheticData(asyncSessionMaker, batches):
+    """Ulozi davky (viz generateSyntheticData) do databaze, co davka to transakce. Vraci pocty radku {jmeno tabulky: pocet}"""
+    counts = {}
+    async with asyncSessionMaker() as session:
+        for DBModel, rows in batches:
+            await upsertRows(session, DBModel, rows)
+            await session.commit()
+            counts[DBModel.__tablename__] = counts.get(DBModel.__tablename__, 0) + len(rows)
+    return counts
 
-    publications = createDataStructurePublications()
-    publicationsToAdd = [PublicationModel(**record) for record in publications]
-    async with session.begin():
-        session.add_all(publicationsToAdd)
-    await session.commit()
 
-    authors = createDataStructureAuthors()
-    authorsToAdd = [AuthorModel(**record) for record in authors]
-    async with session.begin():
-        session.add_all(authorsToAdd)
-    await session.commit()
+def dumpSyntheticData(path, batches):
+    """Zapise davky (viz generateSyntheticData) do json souboru ve tvaru systemdata.json (viz streamTables).
+    Davky jedne tabulky musi nasledovat za sebou. Vraci pocty radku {jmeno tabulky: pocet}
+    """
+    def toJson(value):
+        return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else str(value)
+
+    counts = {}
+    currentTable = None
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for DBModel, rows in batches:
+            tableName = DBModel.__tablename__
+            if tableName != currentTable:
+                assert tableName not in counts, f"batches of {tableName} are not consecutive"
+                f.write("\n]," if currentTable is not None else "")
+                f.write(f"\n{json.dumps(tableName)}: [")
+                currentTable = tableName
+                separator = "\n"
+            for row in rows:
+                f.write(separator)
+                f.write(json.dumps(row, default=toJson, ensure_ascii=False))
+                separator = ",\n"
+            counts[tableName] = counts.get(tableName, 0) + len(rows)
+        f.write("\n]\n}\n" if currentTable is not None else "}\n")
+    return counts
+
+
+async def randomDataStructure(session, **params):
+    """Ulozi synteticka data (parametry viz generateSyntheticData) do databaze"""
+    for DBModel, rows in generateSyntheticData(**params):
+        await upsertRows(session, DBModel, rows)
+        await session.commit()
 
 
 import os
-import json
-from uoishelpers.feeders import ImportModels
-import datetime
 
 def get_demodata():
     def datetime_parser(json_dict):
@@ -334,7 +368,151 @@ def get_demodata():
 
     return jsonData
 
-async def initDB(asyncSessionMaker):
+class JsonStream:
+    """Postupne cteni json textu ze souboru po castech (chunkSize znaku), v pameti je jen necteny zbytek casti"""
+    def __init__(self, file, chunkSize=1 << 20):
+        self.file = file
+        self.chunkSize = chunkSize
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        chunk = self.file.read(self.chunkSize)
+        if chunk == "":
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Vraci dalsi nebily znak (neposouva se), na konci souboru prazdny retezec"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                break
+        return self.buffer[self.position:self.position + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == "" or char not in chars:
+            raise ValueError(f"unexpected {char!r} in json, expected one of {chars!r}")
+        self.position += 1
+        return char
+
+    def decode(self):
+        """Precte jednu json hodnotu (retezec, radek tabulky, ...)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # cislo na konci casti muze pokracovat v dalsi casti
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+def readJsonTables(path, tableNames, batchSize=1000, chunkSize=1 << 20):
+    """Generator, prochazi json soubor ve tvaru {jmeno tabulky: [radky]} a vraci (jmeno tabulky, davka radku)
+    jen pro tabulky z tableNames. Radky ostatnich tabulek jsou dekodovany po jednom a zahozeny,
+    pamet tak zavisi jen na pozadovanych tabulkach. Hodnoty nejsou konvertovany.
+    """
+    tableNames = set(tableNames)
+    with open(path, "r", encoding="utf-8") as f:
+        stream = JsonStream(f, chunkSize=chunkSize)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            tableName = stream.decode()
+            stream.expect(":")
+            wanted = tableName in tableNames
+            if stream.peek() == "[":
+                stream.expect("[")
+                batch = []
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        row = stream.decode()
+                        if wanted:
+                            batch.append(row)
+                            if len(batch) >= batchSize:
+                                yield tableName, batch
+                                batch = []
+                        if stream.expect(",]") == "]":
+                            break
+                if wanted and len(batch) > 0:
+                    yield tableName, batch
+            else:
+                stream.decode()
+                assert not wanted, f"table {tableName} is not a list of rows"
+            if stream.expect(",}") == "}":
+                break
+
+def createRowConverter(DBModel):
+    """Vraci funkci, ktera prevede hodnoty radku z json na typy sloupcu DBModel (uuid, datum, cas),
+    ostatni atributy (napr. _chunk) ponecha beze zmeny
+    """
+    def toUUID(value):
+        return None if value == "" else uuid.UUID(value)
+
+    def toDateTime(value):
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+
+    converters = {}
+    for column in DBModel.__table__.columns:
+        try:
+            pythonType = column.type.python_type
+        except NotImplementedError:
+            continue
+        if pythonType is uuid.UUID:
+            converters[column.name] = toUUID
+        elif pythonType is datetime.datetime:
+            converters[column.name] = toDateTime
+        elif pythonType is datetime.date:
+            converters[column.name] = datetime.date.fromisoformat
+
+    def convert(row):
+        for name, convertValue in converters.items():
+            value = row.get(name, None)
+            if isinstance(value, str):
+                try:
+                    row[name] = convertValue(value)
+                except ValueError:
+                    print("jsonconvert Error", name, value, flush=True)
+                    row[name] = None
+        return row
+
+    return convert
+
+def streamTables(DBModels, path="./systemdata.json", batchSize=1000):
+    """Generator, vraci (DBModel, davka radku s hodnotami dle typu sloupcu) pro tabulky DBModels"""
+    modelIndex = {DBModel.__tablename__: DBModel for DBModel in DBModels}
+    converters = {tableName: createRowConverter(DBModel) for tableName, DBModel in modelIndex.items()}
+    for tableName, rows in readJsonTables(path, modelIndex.keys(), batchSize=batchSize):
+        convert = converters[tableName]
+        yield modelIndex[tableName], [convert(row) for row in rows]
+
+def get_demodata_tables(DBModels, path="./systemdata.json"):
+    """Jako get_demodata, ale nacte (streamovane) jen tabulky DBModels"""
+    result = {}
+    for DBModel, rows in streamTables(DBModels, path=path):
+        result.setdefault(DBModel.__tablename__, []).extend(rows)
+    return result
+
+async def initDB(asyncSessionMaker, force=False):
+    """Naimportuje inicializacni data ze systemdata.json. Tabulky, jejichz data se od posledniho
+    importu nezmenila (otisk ulozeny v databazi), jsou preskoceny, force=True importuje vse.
+    """
+    from src.DBFingerprint import seedFingerprints, seedFingerprintKey, readFingerprints, writeFingerprints
+    from src.DBSeeder import seedModels
 
     defaultNoDemo = "False"
     if defaultNoDemo == os.environ.get("DEMO", defaultNoDemo):
@@ -352,6 +530,22 @@ async def initDB(asyncSessionMaker):
             SubjectModel
         ]
 
-    jsonData = get_demodata()
-    await ImportModels(asyncSessionMaker, dbModels, jsonData)
-    pass
\ No newline at end of file
+    jsonData = get_demodata_tables(dbModels)
+    expected = seedFingerprints(jsonData, dbModels)
+    async with asyncSessionMaker() as session:
+        stored = await readFingerprints(await session.connection())
+    changedModels = [
+        DBModel for DBModel in dbModels
+        if force or stored.get(seedFingerprintKey(DBModel), None) != expected[seedFingerprintKey(DBModel)]
+    ]
+    if len(changedModels) == 0:
+        print("seed fingerprints match, import skipped")
+        return
+
+    await seedModels(asyncSessionMaker, changedModels, jsonData)
+
+    async with asyncSessionMaker() as session:
+        await writeFingerprints(
+            await session.connection(), 
+            {seedFingerprintKey(DBModel): expected[seedFingerprintKey(DBModel)] for DBModel in changedModels})
+        await session.commit()
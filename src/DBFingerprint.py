@@ -0,0 +1,65 @@
+import hashlib
+import json
+
+from sqlalchemy import MetaData, Table, Column, String, DateTime, select, delete, insert, func
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+###########################################################################################################################
+#
+# otisky (fingerprints) schematu a inicializacnich dat ulozene v databazi
+# pokud se otisk nezmenil, start preskoci create_all / import dat (viz startEngine, initDB)
+# tabulka ma vlastni MetaData, neni tak soucasti BaseModel (loadery, otisk schematu, drop_all)
+#
+###########################################################################################################################
+
+fingerprintMetadata = MetaData()
+
+FingerprintTable = Table(
+    "startup_fingerprints", fingerprintMetadata,
+    Column("key", String, primary_key=True, comment="schema or seed:<table name>"),
+    Column("value", String, comment="sha256 hexdigest"),
+    Column("lastchange", DateTime, server_default=func.now()),
+)
+
+def hashText(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def schemaFingerprint(dialect):
+    """Otisk DDL vsech tabulek a indexu modelu (vcetne fulltextu) pro dany dialekt"""
+    from src.DBDefinitions import BaseModel
+    from src.DBSearch import POSTGRESSEARCH, SQLITESEARCH
+
+    parts = []
+    for table in BaseModel.metadata.sorted_tables:
+        parts.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            parts.append(str(CreateIndex(index).compile(dialect=dialect)))
+    parts.extend(POSTGRESSEARCH)
+    parts.extend(SQLITESEARCH)
+    return hashText("\n".join(parts))
+
+def seedFingerprintKey(DBModel):
+    return f"seed:{DBModel.__tablename__}"
+
+def seedFingerprints(jsonData, DBModels):
+    """Otisky inicializacnich dat jednotlivych tabulek, jsonData je {jmeno tabulky: [radky]} (viz get_demodata_tables)"""
+    return {
+        seedFingerprintKey(DBModel): hashText(json.dumps(jsonData.get(DBModel.__tablename__, None), sort_keys=True, default=str))
+        for DBModel in DBModels
+    }
+
+async def readFingerprints(connection):
+    """Vraci ulozene otisky {key: value}, tabulku otisku pripadne zalozi"""
+    await connection.run_sync(fingerprintMetadata.create_all)
+    rows = await connection.execute(select(FingerprintTable.c.key, FingerprintTable.c.value))
+    return {key: value for key, value in rows}
+
+async def writeFingerprints(connection, fingerprints):
+    await connection.run_sync(fingerprintMetadata.create_all)
+    await connection.execute(delete(FingerprintTable).where(FingerprintTable.c.key.in_(list(fingerprints.keys()))))
+    await connection.execute(insert(FingerprintTable), [{"key": key, "value": value} for key, value in fingerprints.items()])
+
+async def clearFingerprints(connection):
+    """Zahodi vsechny otisky, dalsi start provede vse (napr. po drop_all)"""
+    await connection.run_sync(fingerprintMetadata.create_all)
+    await connection.execute(delete(FingerprintTable))
@@ -0,0 +1,94 @@
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from prometheus_client import Gauge, Histogram, Counter
+
+###########################################################################################################################
+#
+# metriky poolu databazovych spojeni (prometheus)
+# pri behu pod gunicornem s vice workery nastavte PROMETHEUS_MULTIPROC_DIR, gauge jsou pak scitany pres zive procesy
+#
+###########################################################################################################################
+
+# kazdy pool (primarni databaze, replika) ma vlastni serie, label pool je pool_logging_name enginu (viz startEngine)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections", "Connections currently checked out from the pool",
+    labelnames=["pool"], multiprocess_mode="livesum")
+POOL_WAITERS = Gauge(
+    "db_pool_waiters", "Callers currently waiting for a connection of an exhausted pool",
+    labelnames=["pool"], multiprocess_mode="livesum")
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pool connection",
+    labelnames=["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts", "Pool checkouts which failed on timeout",
+    labelnames=["pool"])
+
+
+# sdilena cache entit (viz src.Dataloaders.EntityCache), label model je jmeno tabulky
+ENTITYCACHE_LOOKUPS = Counter(
+    "entity_cache_lookups", "Entity cache lookups by result (hit, miss, stale)",
+    labelnames=["model", "result"])
+ENTITYCACHE_EVICTIONS = Counter(
+    "entity_cache_evictions", "Entities evicted from the entity cache (LRU)",
+    labelnames=["model"])
+ENTITYCACHE_ENTRIES = Gauge(
+    "entity_cache_entries", "Entities currently held in the entity cache",
+    multiprocess_mode="livesum")
+ENTITYCACHE_BYTES = Gauge(
+    "entity_cache_bytes", "Estimated size of entities held in the entity cache",
+    multiprocess_mode="livesum")
+
+
+def poolLabel(pool):
+    return pool.logging_name or "default"
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, ktery meri cekani na spojeni a pocet cekajicich"""
+    def _do_get(self):
+        label = poolLabel(self)
+        # ceka se jen pokud jsou pujcena vsechna spojeni vcetne overflow (max_overflow -1 je bez omezeni)
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        if exhausted:
+            POOL_WAITERS.labels(label).inc()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(label).inc()
+            raise
+        finally:
+            if exhausted:
+                POOL_WAITERS.labels(label).dec()
+            POOL_CHECKOUT_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+
+def instrumentEngine(asyncEngine):
+    """Pocita pujcena spojeni, funguje pro libovolny pool"""
+    pool = asyncEngine.sync_engine.pool
+    checkedOut = POOL_CHECKED_OUT.labels(poolLabel(pool))
+
+    @event.listens_for(pool, "checkout")
+    def onCheckout(dbapiConnection, connectionRecord, connectionProxy):
+        checkedOut.inc()
+
+    @event.listens_for(pool, "checkin")
+    def onCheckin(dbapiConnection, connectionRecord):
+        checkedOut.dec()
+
+    return asyncEngine
+
+
+def createMetricsApp():
+    """ASGI aplikace pro /metrics, respektuje multiprocess rezim prometheus_client"""
+    from prometheus_client import make_asgi_app, CollectorRegistry, multiprocess
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR", None) is None:
+        return make_asgi_app()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return make_asgi_app(registry=registry)
@@ -0,0 +1,95 @@
+import re
+
+import sqlalchemy
+from sqlalchemy import select, func, literal_column, text, Float
+
+from src.DBDefinitions import PublicationModel, dropInvalidIndexes
+
+###########################################################################################################################
+#
+# fulltextove vyhledavani publikaci (name, place, reference)
+# - postgres: generovany sloupec publications.search_vector (tsvector) s GIN indexem, razeni ts_rank
+# - sqlite (testy, demo): FTS5 tabulka publications_fts s externim obsahem, udrzovana triggery, razeni bm25
+# sloupec ani FTS tabulka nejsou soucasti modelu, create_all by je neumel vytvorit pro oba dialekty
+# ani doplnit do existujici databaze, zaklada je ensureSearch
+#
+###########################################################################################################################
+
+POSTGRESSEARCH = [
+    """ALTER TABLE publications ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(place, '') || ' ' || coalesce(reference, '')), 'B')
+    ) STORED""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_publications_search_vector ON publications USING GIN (search_vector)""",
+]
+
+SQLITESEARCH = [
+    # diakritika je zachovana stejne jako u postgres konfigurace 'simple'
+    """CREATE VIRTUAL TABLE IF NOT EXISTS publications_fts USING fts5(
+        name, place, reference, content='publications', content_rowid='rowid', tokenize='unicode61 remove_diacritics 0'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS publications_fts_insert AFTER INSERT ON publications BEGIN
+        INSERT INTO publications_fts(rowid, name, place, reference) VALUES (new.rowid, new.name, new.place, new.reference);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS publications_fts_delete AFTER DELETE ON publications BEGIN
+        INSERT INTO publications_fts(publications_fts, rowid, name, place, reference) VALUES ('delete', old.rowid, old.name, old.place, old.reference);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS publications_fts_update AFTER UPDATE ON publications BEGIN
+        INSERT INTO publications_fts(publications_fts, rowid, name, place, reference) VALUES ('delete', old.rowid, old.name, old.place, old.reference);
+        INSERT INTO publications_fts(rowid, name, place, reference) VALUES (new.rowid, new.name, new.place, new.reference);
+    END""",
+    # po drop_all muze FTS tabulka obsahovat data smazane tabulky
+    """INSERT INTO publications_fts(publications_fts) VALUES ('rebuild')""",
+]
+
+async def ensureSearch(asyncEngine):
+    """Zalozi (pokud chybi) struktury pro fulltextove vyhledavani, vola se pri startu po create_all"""
+    dialectName = asyncEngine.dialect.name
+    if dialectName == "postgresql":
+        statements = POSTGRESSEARCH
+    elif dialectName == "sqlite":
+        statements = SQLITESEARCH
+    else:
+        return False
+
+    async with asyncEngine.connect() as conn:
+        if dialectName == "postgresql":
+            # CONCURRENTLY nelze v transakci
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            # nedokonceny GIN index (INVALID) by IF NOT EXISTS preskocilo
+            await conn.run_sync(dropInvalidIndexes, {"ix_publications_search_vector"})
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.commit()
+    return True
+
+def searchTerms(query):
+    """Slova dotazu, hledaji se publikace obsahujici vsechna slova"""
+    return re.findall(r"\w+", query)
+
+def createSearchStatement(dialectName, query):
+    """Vraci (select publikaci odpovidajicich dotazu, vyraz relevance), vyssi relevance je lepsi.
+    Pro dotaz bez slov vraci (None, None).
+    """
+    terms = searchTerms(query)
+    if len(terms) == 0:
+        return None, None
+
+    if dialectName == "postgresql":
+        searchVector = literal_column("publications.search_vector")
+        tsQuery = func.plainto_tsquery(literal_column("'simple'"), " ".join(terms))
+        rank = func.ts_rank(searchVector, tsQuery, type_=Float)
+        statement = select(PublicationModel).where(searchVector.op("@@")(tsQuery))
+        return statement, rank
+
+    assert dialectName == "sqlite", f"fulltext search is not available for {dialectName}"
+    fts = literal_column("publications_fts")
+    ftsQuery = " ".join(f'"{term}"' for term in terms)
+    # bm25 je mensi pro relevantnejsi radky, jmeno ma vetsi vahu nez misto a reference
+    rank = -func.bm25(fts, 10.0, 1.0, 1.0, type_=Float)
+    statement = (
+        select(PublicationModel)
+        .join(sqlalchemy.table("publications_fts"), literal_column("publications_fts.rowid") == literal_column("publications.rowid"))
+        .where(fts.op("MATCH")(ftsQuery))
+    )
+    return statement, rank
@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+import time
+
+import sqlalchemy
+from sqlalchemy import or_, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+###########################################################################################################################
+#
+# hromadne (bulk) ukladani inicializacnich a generovanych dat s upsert semantikou
+# - postgres + asyncpg: COPY do docasne tabulky a INSERT ... SELECT ... ON CONFLICT (id) DO UPDATE
+# - ostatni (sqlite, postgres s jinym driverem): executemany INSERT ... ON CONFLICT (id) DO UPDATE
+# opakovane ulozeni stejnych dat nic nezmeni (ani lastchange), zmenene radky jsou prepsany
+#
+###########################################################################################################################
+
+def mapToColumns(DBModel, row):
+    """Z radku vybere jen atributy, ktere jsou sloupci DBModel, None hodnoty vynecha (uplatni se default),
+    stejne jako putPredefinedStructuresIntoTable
+    """
+    columns = DBModel.__table__.columns
+    return {key: value for key, value in row.items() if key in columns and value is not None}
+
+def groupRows(DBModel, rows):
+    """Rozdeli radky do fazi podle _chunk (poradi ukladani) a ve fazi podle mnoziny sloupcu,
+    jeden prikaz tak vzdy uklada radky se stejnymi sloupci
+    """
+    phases = {}
+    for row in rows:
+        mapped = mapToColumns(DBModel, row)
+        phase = phases.setdefault(row.get("_chunk", 0), {})
+        phase.setdefault(tuple(sorted(mapped.keys())), []).append(mapped)
+    for chunkNumber in sorted(phases.keys()):
+        for columnNames, groupedRows in phases[chunkNumber].items():
+            yield list(columnNames), groupedRows
+
+def createUpsertStatement(insertStatement, DBModel, columnNames):
+    """Doplni insertStatement (postgresql / sqlite insert) o ON CONFLICT (id) DO UPDATE,
+    radek je prepsan jen pokud se lisi, lastchange (neni-li soucasti dat) je pak aktualizovan
+    """
+    table = DBModel.__table__
+    excluded = insertStatement.excluded
+    updatedNames = [name for name in columnNames if name != "id"]
+    if len(updatedNames) == 0:
+        return insertStatement.on_conflict_do_nothing(index_elements=["id"])
+    values = {name: excluded[name] for name in updatedNames}
+    if "lastchange" in table.columns and "lastchange" not in values:
+        values["lastchange"] = func.now()
+    return insertStatement.on_conflict_do_update(
+        index_elements=["id"],
+        set_=values,
+        where=or_(*[table.c[name].is_distinct_from(excluded[name]) for name in updatedNames])
+    )
+
+async def copyUpsertRows(connection, DBModel, columnNames, rows, stagingName):
+    """COPY radku do docasne tabulky (asyncpg copy_records_to_table) a jejich upsert do tabulky DBModel"""
+    table = DBModel.__table__
+    preparer = connection.dialect.identifier_preparer
+    quotedColumns = ", ".join(preparer.quote(name) for name in columnNames)
+    await connection.execute(sqlalchemy.text(
+        f"CREATE TEMP TABLE {stagingName} ON COMMIT DROP AS "
+        f"SELECT {quotedColumns} FROM {preparer.format_table(table)} WITH NO DATA"))
+
+    rawConnection = await connection.get_raw_connection()
+    await rawConnection.driver_connection.copy_records_to_table(
+        stagingName,
+        records=[tuple(row[name] for name in columnNames) for row in rows],
+        columns=columnNames)
+
+    stagingTable = sqlalchemy.table(stagingName, *[sqlalchemy.column(name) for name in columnNames])
+    statement = postgresql.insert(table).from_select(columnNames, sqlalchemy.select(*stagingTable.c))
+    await connection.execute(createUpsertStatement(statement, DBModel, columnNames))
+    await connection.execute(sqlalchemy.text(f"DROP TABLE {stagingName}"))
+
+async def upsertRows(session, DBModel, rows, batchSize=5000):
+    """Ulozi radky (list of dict) do tabulky DBModel, existujici id prepise (upsert), neprovadi commit"""
+    connection = await session.connection()
+    dialect = connection.dialect
+    useCopy = dialect.name == "postgresql" and dialect.driver == "asyncpg"
+    if dialect.name == "postgresql":
+        insert = postgresql.insert
+    elif dialect.name == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f"bulk upsert is not available for {dialect.name}")
+
+    counter = itertools.count()
+    for columnNames, groupedRows in groupRows(DBModel, rows):
+        for index in range(0, len(groupedRows), batchSize):
+            batch = groupedRows[index:index + batchSize]
+            if useCopy:
+                stagingName = f"staging_{DBModel.__tablename__}_{next(counter)}"
+                await copyUpsertRows(connection, DBModel, columnNames, batch, stagingName)
+            else:
+                statement = createUpsertStatement(insert(DBModel.__table__), DBModel, columnNames)
+                await connection.execute(statement, batch)
+    return len(rows)
+
+def normalizeTableName(name):
+    """publication_types -> publicationtype, publicationcategories -> publicationcategory"""
+    name = name.replace("_", "").lower()
+    if name.endswith("ies"):
+        return name[:-3] + "y"
+    if name.endswith("s"):
+        return name[:-1]
+    return name
+
+def dependencies(DBModel, DBModels):
+    """Modely z DBModels, na ktere DBModel odkazuje. Cizi klice nejsou v modelech deklarovany,
+    cilova tabulka je odvozena ze jmena sloupce (publication_type_id -> publicationtypes), pripadne z ForeignKey.
+    Odkazy na sebe sama (resi _chunk) a na tabulky mimo DBModels (user_id, ...) jsou vynechany.
+    """
+    tables = {DBModel.__tablename__: DBModel for DBModel in DBModels}
+    normalized = {normalizeTableName(tableName): tableName for tableName in tables.keys()}
+    result = set()
+    for column in DBModel.__table__.columns:
+        targets = [foreignKey.column.table.name for foreignKey in column.foreign_keys]
+        if len(targets) == 0 and column.name.endswith("_id"):
+            prefix = normalizeTableName(column.name[:-3])
+            if prefix in normalized:
+                targets = [normalized[prefix]]
+            else:
+                # publicationcategory <- category_id
+                targets = [tableName for key, tableName in normalized.items() if key.endswith(prefix)]
+                if len(targets) != 1:
+                    targets = []
+        result.update(tables[target] for target in targets if target in tables and target != DBModel.__tablename__)
+    return result
+
+def dependencyLevels(DBModels):
+    """Rozdeli DBModels do urovni, modely jedne urovne na sobe nezavisi a odkazuji jen na predchozi urovne"""
+    remaining = {DBModel: dependencies(DBModel, DBModels) for DBModel in DBModels}
+    levels = []
+    while len(remaining) > 0:
+        level = [DBModel for DBModel, required in remaining.items() if len(required) == 0]
+        assert len(level) > 0, f"cyclic dependency among {[DBModel.__tablename__ for DBModel in remaining]}"
+        levels.append(level)
+        remaining = {
+            DBModel: required.difference(level)
+            for DBModel, required in remaining.items() if DBModel not in level
+        }
+    return levels
+
+async def seedModels(asyncSessionMaker, DBModels, jsonData, batchSize=5000):
+    """Hromadne ulozi data tabulek DBModels z jsonData ({jmeno tabulky: [radky]}), co tabulka to transakce.
+    Nahrada ImportModels, misto vynechani existujicich id je prepisuje.
+    Tabulky jsou ukladany po urovnich zavislosti (viz dependencyLevels), tabulky jedne urovne soucasne
+    pres samostatna spojeni z poolu (sqlite ma jen jednoho zapisovatele, tam postupne).
+    """
+    async def seedModel(DBModel):
+        rows = jsonData.get(DBModel.__tablename__, [])
+        if len(rows) == 0:
+            return
+        start = time.perf_counter()
+        async with asyncSessionMaker() as session:
+            await upsertRows(session, DBModel, rows, batchSize=batchSize)
+            await session.commit()
+        print(f"seeded {DBModel.__tablename__}: {len(rows)} rows in {time.perf_counter() - start:.3f} s", flush=True)
+
+    concurrent = asyncSessionMaker.kw["bind"].dialect.name != "sqlite"
+    for level in dependencyLevels(DBModels):
+        if concurrent:
+            await asyncio.gather(*[seedModel(DBModel) for DBModel in level])
+        else:
+            for DBModel in level:
+                await seedModel(DBModel)
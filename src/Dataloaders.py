@@ -1,9 +1,19 @@
+import asyncio
 import logging
 from uoishelpers.dataloaders import createIdLoader
 import uuid
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from src.DBMetrics import ENTITYCACHE_LOOKUPS, ENTITYCACHE_EVICTIONS, ENTITYCACHE_ENTRIES, ENTITYCACHE_BYTES
 
 from src.DBDefinitions import (
     BaseModel,
+    PublicationModel,
+    PublicationTypeModel,
+    PublicationCategoryModel,
     # UserModel,
     # MembershipModel,
     # GroupModel,
@@ -17,23 +27,467 @@ from src.DBDefinitions import (
 # from uoishelpers.resolvers import select, update, delete
 
 from uoishelpers.dataloaders import createIdLoader
-from functools import cache
+from functools import cached_property
 
-def createLoaders(asyncSessionMaker):
+from aiodataloader import DataLoader
+from graphql import OperationType
+from sqlalchemy.future import select
+
+def createFkeyLoader(asyncSessionMaker, DBModel, foreignKeyName, idLoader=None):
+    """Vytvori DataLoader, ktery pro hodnotu ciziho klice foreignKeyName vraci list radku DBModel.
+    Vsechny klice pozadovane behem jednoho cyklu event loop jsou nacteny jednim dotazem WHERE fk IN (...).
+    Je-li dan idLoader, nactene radky jsou do nej vlozeny (prime), aby se pri resolve_reference necetly znovu.
+    """
+    foreignKey = getattr(DBModel, foreignKeyName)
+    mainstmt = select(DBModel)
+    if hasattr(DBModel, "order"):
+        mainstmt = mainstmt.order_by(DBModel.order)
+
+    async def selectGrouped(session, keys):
+        groupedRows = {key: [] for key in keys}
+        statement = mainstmt.filter(foreignKey.in_(list(groupedRows.keys())))
+        rows = await session.execute(statement)
+        for row in rows.scalars():
+            groupedRows[getattr(row, foreignKeyName)].append(row)
+            if idLoader is not None:
+                idLoader.prime(row.id, row)
+        return groupedRows
+
+    def toUUID(key):
+        # id z federace (_entities) prichazi jako str, hodnoty cizich klicu v radcich jsou uuid.UUID
+        return uuid.UUID(key) if isinstance(key, str) else key
+
+    class FkeyLoader(DataLoader):
+        async def batch_load_fn(self, keys):
+            keys = [toUUID(key) for key in keys]
+            async with asyncSessionMaker() as session:
+                groupedRows = await selectGrouped(session, keys)
+            return [groupedRows[key] for key in keys]
+
+        async def prefetch(self, session, keys):
+            """Nacte radky pro keys v ramci dodane session (lookahead) a vlozi je do loaderu"""
+            groupedRows = await selectGrouped(session, [toUUID(key) for key in keys])
+            for key, rows in groupedRows.items():
+                self.prime(key, rows)
+
+    return FkeyLoader(cache=True)
+
+async def prefetch(session, loader, keys):
+    """Nacte do loaderu radky pro keys jednim dotazem v ramci dodane session.
+    Pouziva se pro lookahead v root resolverech, vnorena pole pak data ctou z loaderu bez dalsiho dotazu.
+    """
+    if hasattr(loader, "prefetch"):
+        return await loader.prefetch(session, keys)
+    DBModel = loader.getModel()
+    if DBModel in lookupTables:
+        # ciselniky jsou v pameti, neni co nacitat
+        return
+    rows = await session.execute(select(DBModel).filter(DBModel.id.in_(keys)))
+    for row in rows.scalars():
+        loader.prime(row.id, row)
+
+class LookupTablesCache:
+    """Sdilena (procesova) read-through cache pro male ciselnikove tabulky (typy, kategorie).
+    Tabulka je nactena cela jednim dotazem a drzena v pameti, po uplynuti ttl (v sekundach)
+    nebo po zavolani invalidate je pri dalsim pozadavku nactena znovu.
+    """
+    def __init__(self, DBModels, ttl=300):
+        self.DBModels = DBModels
+        self.ttl = ttl
+        self._tables = {}
+
+    def __contains__(self, DBModel):
+        return DBModel in self.DBModels
+
+    async def preload(self, asyncSessionMaker):
+        for DBModel in self.DBModels:
+            await self.getTable(asyncSessionMaker, DBModel)
+
+    async def getTable(self, asyncSessionMaker, DBModel):
+        """Vraci slovnik {id: radek} pro DBModel, pripadne jej nejdrive nacte z databaze"""
+        # klicem je i asyncSessionMaker, aby se nemichala data ruznych databazi (napr. v testech)
+        cacheKey = (asyncSessionMaker, DBModel)
+        loaded = self._tables.get(cacheKey, None)
+        if loaded is not None:
+            loadedAt, table = loaded
+            if time.monotonic() - loadedAt < self.ttl:
+                return table
+
+        async with asyncSessionMaker() as session:
+            rows = await session.execute(select(DBModel))
+            table = {row.id: row for row in rows.scalars()}
+        self._tables[cacheKey] = (time.monotonic(), table)
+        logging.info(f"lookup table {DBModel.__tablename__} loaded, {len(table)} rows")
+        return table
+
+    def invalidate(self, DBModel=None):
+        """Zahodi nactena data DBModel (nebo vsech tabulek, je-li DBModel None)"""
+        for cacheKey in list(self._tables.keys()):
+            if DBModel is None or cacheKey[1] is DBModel:
+                del self._tables[cacheKey]
+
+lookupTables = LookupTablesCache(
+    [PublicationTypeModel, PublicationCategoryModel],
+    ttl=float(os.environ.get("LOOKUPCACHE_TTL", "300"))
+)
+
+def createLookupIdLoader(asyncSessionMaker, DBModel):
+    """Id loader, ktery cte radky z lookupTables, do databaze jde jen pro id, ktera v cache nejsou"""
+    loader = createIdLoader(asyncSessionMaker, DBModel)
+    batch_load_from_db = loader.batch_load_fn
+
+    async def batch_load_fn(keys):
+        table = await lookupTables.getTable(asyncSessionMaker, DBModel)
+        missingKeys = [key for key in keys if key not in table]
+        missingRows = dict(zip(missingKeys, await batch_load_from_db(missingKeys))) if missingKeys else {}
+        return [table[key] if key in table else missingRows[key] for key in keys]
+
+    loader.batch_load_fn = batch_load_fn
+    return loader
+
+class EntityCache:
+    """Sdilena (procesova) LRU cache entit, omezena poctem zaznamu a odhadem velikosti v bytech.
+    Zaznamy jsou pred pouzitim overeny proti sloupci lastchange (jeden lehky dotaz na davku klicu),
+    mutace (encapsulateInsert/Update/Delete) prislusny zaznam zahazuji.
+    maxEntries == 0 cache vypina.
+    Pocitadla (stats) jsou zaroven publikovana jako prometheus metriky entity_cache_* (viz DBMetrics).
+    """
+    def __init__(self, DBModels, maxEntries=10000, maxBytes=64 * 1024 * 1024):
+        self.DBModels = DBModels
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def __contains__(self, DBModel):
+        return self.maxEntries > 0 and DBModel in self.DBModels
+
+    @staticmethod
+    def estimateSize(row):
+        return sum(sys.getsizeof(getattr(row, column.key)) for column in row.__table__.columns)
+
+    def record(self, DBModel, result, count=1):
+        """Zapocita vysledek hledani v cache, result je hits, misses nebo stale"""
+        setattr(self, result, getattr(self, result) + count)
+        ENTITYCACHE_LOOKUPS.labels(DBModel.__tablename__, result).inc(count)
+
+    def updateGauges(self):
+        ENTITYCACHE_ENTRIES.set(len(self._entries))
+        ENTITYCACHE_BYTES.set(self.bytes)
+
+    def peek(self, DBModel, id):
+        entry = self._entries.get((DBModel, id), None)
+        return None if entry is None else entry[0]
+
+    def touch(self, DBModel, id):
+        self._entries.move_to_end((DBModel, id))
+
+    def put(self, DBModel, row):
+        self.invalidate(DBModel, row.id)
+        size = EntityCache.estimateSize(row)
+        if size > self.maxBytes:
+            return
+        self._entries[(DBModel, row.id)] = (row, size)
+        self.bytes += size
+        while len(self._entries) > self.maxEntries or self.bytes > self.maxBytes:
+            (evictedModel, _), (_, evictedSize) = self._entries.popitem(last=False)
+            self.bytes -= evictedSize
+            self.evictions += 1
+            ENTITYCACHE_EVICTIONS.labels(evictedModel.__tablename__).inc()
+        self.updateGauges()
+
+    def invalidate(self, DBModel, id):
+        entry = self._entries.pop((DBModel, id), None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            self.updateGauges()
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.updateGauges()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions
+        }
+
+entityCache = EntityCache(
+    [PublicationModel],
+    maxEntries=int(os.environ.get("ENTITYCACHE_ENTRIES", "10000")),
+    maxBytes=int(os.environ.get("ENTITYCACHE_BYTES", f"{64 * 1024 * 1024}"))
+)
+
+def createEntityCachedIdLoader(asyncSessionMaker, DBModel):
+    """Id loader, ktery vraci entity z entityCache, pokud se jejich lastchange v databazi nezmenil"""
+    loader = createIdLoader(asyncSessionMaker, DBModel)
+    batch_load_from_db = loader.batch_load_fn
+    validationStatement = select(DBModel.id, DBModel.lastchange)
+
+    async def batch_load_fn(keys):
+        cachedRows = {}
+        for key in keys:
+            row = entityCache.peek(DBModel, key)
+            if row is not None:
+                cachedRows[key] = row
+
+        validRows = {}
+        if cachedRows:
+            async with asyncSessionMaker() as session:
+                statement = validationStatement.filter(DBModel.id.in_(list(cachedRows.keys())))
+                tokens = await session.execute(statement)
+                lastchanges = {id: lastchange for id, lastchange in tokens}
+            for key, row in cachedRows.items():
+                if key in lastchanges and lastchanges[key] == row.lastchange:
+                    entityCache.touch(DBModel, key)
+                    entityCache.record(DBModel, "hits")
+                    validRows[key] = row
+                else:
+                    entityCache.invalidate(DBModel, key)
+                    entityCache.record(DBModel, "stale")
+
+        missingKeys = [key for key in keys if key not in validRows]
+        entityCache.record(DBModel, "misses", len(missingKeys))
+        if missingKeys:
+            for key, row in zip(missingKeys, await batch_load_from_db(missingKeys)):
+                if row is not None:
+                    entityCache.put(DBModel, row)
+                validRows[key] = row
+        return [validRows[key] for key in keys]
+
+    loader.batch_load_fn = batch_load_fn
+    return loader
+
+class UserRolesCache:
+    """Sdilena (procesova) TTL cache roli uzivatelu, klicem je id uzivatele, omezena poctem zaznamu (LRU).
+    Uzivatel bez roli je zapamatovan na kratsi dobu (negativeTtl). Soubezna cteni roli jednoho uzivatele
+    (vice poli jednoho pozadavku, vice pozadavku) vedou jen k jednomu nacteni.
+    Role jsou spravovany v UG (tento kontejner je nemeni), zaznamy proto jen expiruji po ttl,
+    zmena role se projevi nejpozdeji po ttl sekundach. invalidate (resp. invalidateUserRoles) je
+    pro pripad, kdy se o zmene vi (napr. testy, administrace).
+    """
+    def __init__(self, ttl=60, negativeTtl=10, maxEntries=10000):
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, userId, load):
+        """Vraci role uzivatele, pri chybejicim nebo proslem zaznamu zavola await load(userId)"""
+        entry = self._entries.get(userId, None)
+        if entry is not None:
+            expiresAt, roles = entry
+            if time.monotonic() < expiresAt:
+                self._entries.move_to_end(userId)
+                self.hits += 1
+                return roles
+            del self._entries[userId]
+
+        pending = self._pending.get(userId, None)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        pending = asyncio.ensure_future(load(userId))
+        self._pending[userId] = pending
+        try:
+            roles = await asyncio.shield(pending)
+        finally:
+            if self._pending.get(userId, None) is pending:
+                del self._pending[userId]
+        self.put(userId, roles)
+        return roles
+
+    def put(self, userId, roles):
+        if self.maxEntries == 0:
+            return
+        ttl = self.ttl if len(roles) > 0 else self.negativeTtl
+        self._entries[userId] = (time.monotonic() + ttl, roles)
+        self._entries.move_to_end(userId)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, userId=None):
+        """Zahodi role uzivatele (nebo vsech uzivatelu, je-li userId None)"""
+        if userId is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(userId, None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+userRolesCache = UserRolesCache(
+    ttl=float(os.environ.get("ROLECACHE_TTL", "60")),
+    negativeTtl=float(os.environ.get("ROLECACHE_NEGATIVE_TTL", "10")),
+    maxEntries=int(os.environ.get("ROLECACHE_ENTRIES", "10000"))
+)
+
+def invalidateUserRoles(userId=None):
+    """Zahodi sdilene role uzivatele (nebo bez userId role vsech uzivatelu), jinak zaznamy expiruji po ttl"""
+    userRolesCache.invalidate(userId)
+
+ROLEFRAGMENT = """
+fragment role on RoleGQLModel {
+  id
+  valid
+  roletype { id }
+  user { id }
+  group { id }
+}
+"""
+
+def createRbacObjectRolesQuery(count):
+    """Jeden dotaz na role count rbacobjektu (uzivatel nebo skupina), promenne $id0 ... $id{count - 1}"""
+    variables = ", ".join(f"$id{index}: UUID!" for index in range(count))
+    fields = "\n".join(
+        f"  user{index}: rolesOnUser(userId: $id{index}) {{ ...role }}\n"
+        f"  group{index}: rolesOnGroup(groupId: $id{index}) {{ ...role }}"
+        for index in range(count)
+    )
+    return f"query ({variables}) {{\n{fields}\n}}\n{ROLEFRAGMENT}"
+
+def normalizeRole(role):
+    """Role z UG ve tvaru pouzivanem RBACPermission (user_id jako UUID kvuli porovnani s prihlasenym uzivatelem)"""
+    user = role.get("user", None) or {}
+    group = role.get("group", None) or {}
+    roletype = role.get("roletype", None) or {}
+    return {
+        **role,
+        "user_id": None if user.get("id", None) is None else uuid.UUID(f"{user['id']}"),
+        "group_id": group.get("id", None),
+        "roletype_id": roletype.get("id", None),
+    }
+
+class UGRequestError(Exception):
+    """Dotaz na GQLUG_ENDPOINT_URL selhal (adresa neni nastavena, chybny status nebo chyby v odpovedi)"""
+
+ugSession = {"session": None, "loop": None}
+
+def getUGSession():
+    """Sdilena aiohttp.ClientSession pro dotazy na UG, vytvori se pri prvnim pouziti a drzi se po dobu behu
+    aplikace (spojeni jsou tak znovu pouzivana), uzavira ji closeUGSession. Session je vazana na event loop,
+    pro jiny loop (napr. v testech) je vytvorena nova.
+    """
+    import aiohttp
+    loop = asyncio.get_running_loop()
+    session = ugSession["session"]
+    if session is None or session.closed or ugSession["loop"] is not loop:
+        session = aiohttp.ClientSession()
+        ugSession.update(session=session, loop=loop)
+    return session
+
+async def closeUGSession():
+    """Uzavre sdilenou session (pri ukonceni aplikace)"""
+    session = ugSession["session"]
+    ugSession.update(session=None, loop=None)
+    if session is not None and not session.closed:
+        await session.close()
+
+async def queryUG(query, variables={}):
+    """Provede dotaz na GQLUG_ENDPOINT_URL pres sdilenou session, vraci data odpovedi"""
+    url = os.environ.get("GQLUG_ENDPOINT_URL", None)
+    if url is None:
+        raise UGRequestError("GQLUG_ENDPOINT_URL is not defined")
+    json = {"query": query, "variables": variables}
+    async with getUGSession().post(url=url, json=json) as resp:
+        if resp.status != 200:
+            raise UGRequestError(f"{url} responded with status {resp.status}")
+        respJson = await resp.json()
+    errors = respJson.get("errors", None)
+    if errors is not None:
+        raise UGRequestError(f"{url} responded with errors {errors}")
+    return respJson["data"]
+
+async def fetchRbacObjectRoles(rbacobjects):
+    """Role vztazene ke kazdemu z rbacobjects, jeden pozadavek na GQLUG_ENDPOINT_URL pro celou davku"""
+    data = await queryUG(
+        createRbacObjectRolesQuery(len(rbacobjects)),
+        {f"id{index}": f"{rbacobject}" for index, rbacobject in enumerate(rbacobjects)}
+    )
+    return [
+        [normalizeRole(role) for role in [*(data.get(f"user{index}", None) or []), *(data.get(f"group{index}", None) or [])]]
+        for index in range(len(rbacobjects))
+    ]
+
+def createAuthorizationLoader(fetchRoles=fetchRbacObjectRoles, maxBatchSize=100):
+    """Loader roli vztazenych k rbacobject (loaders.authorizations.load(rbacobject) -> [role, ...]).
+    Kontroly opravneni radku seznamu jsou tak spojeny do jednoho dotazu na UG, vysledek je drzen po dobu pozadavku.
+    """
+    async def batch_load_fn(keys):
+        return await fetchRoles(list(keys))
+
+    return DataLoader(batch_load_fn=batch_load_fn, max_batch_size=maxBatchSize)
+
+def invalidateSharedCaches(DBModel, id=None):
+    """Zahodi data DBModel ze sdilenych (mezipozadavkovych) cache, vola se po kazde mutaci"""
+    if DBModel in lookupTables:
+        lookupTables.invalidate(DBModel)
+    if DBModel in entityCache and id is not None:
+        entityCache.invalidate(DBModel, id)
+
+def foreignKeyNames(DBModel):
+    """Vraci jmena sloupcu DBModel, ktere jsou cizimi klici (konci na _id)"""
+    return [column.name for column in DBModel.__table__.columns if column.name.endswith("_id")]
+
+def createLoadersClass():
+    """Vytvori tridu Loaders, vola se jen jednou pri importu.
+    Kazdy atribut je cached_property, loader je tedy vytvoren az pri prvnim pouziti v ramci pozadavku
+    a instance (jedna na pozadavek) si jej pamatuje.
+    """
 
     def createLambda(loaderName, DBModel):
-        return lambda self: createIdLoader(asyncSessionMaker, DBModel)
+        # id loadery zamerne nacitaji cele radky (bez projekce podle selection setu), radek pod jednim id
+        # sdili vsechny resolvery pozadavku (fkey loadery, resolveDeferredColumn, mutace) i entityCache,
+        # castecne nacteny radek by tak dalsim polim chybel, projekci provadi jen page resolvery
+        # (viz createProjectedPageResolver)
+        if DBModel in lookupTables:
+            return lambda self: createLookupIdLoader(self.asyncSessionMaker, DBModel)
+        if DBModel in entityCache:
+            return lambda self: createEntityCachedIdLoader(self.asyncSessionMaker, DBModel)
+        return lambda self: createIdLoader(self.asyncSessionMaker, DBModel)
+
+    def createAliasLambda(loaderName):
+        return lambda self: getattr(self, loaderName)
+
+    def createFkeyLambda(DBModel, foreignKeyName):
+        return lambda self: createFkeyLoader(
+            self.asyncSessionMaker, DBModel, foreignKeyName, idLoader=getattr(self, DBModel.__name__)
+        )
 
-    attrs = {}
+    def __init__(self, asyncSessionMaker):
+        self.asyncSessionMaker = asyncSessionMaker
+
+    attrs = {"__init__": __init__}
 
     for DBModel in BaseModel.registry.mappers:
         cls = DBModel.class_
-        attrs[cls.__tablename__] = property(cache(createLambda(asyncSessionMaker, cls)))
-        attrs[cls.__name__] = attrs[cls.__tablename__]
+        attrs[cls.__name__] = cached_property(createLambda(cls.__name__, cls))
+        attrs[cls.__tablename__] = property(createAliasLambda(cls.__name__))
+        for foreignKeyName in foreignKeyNames(cls):
+            # napr. loaders.AuthorModel_by_publication_id.load(publication_id) -> [AuthorModel, ...]
+            attrs[f"{cls.__name__}_by_{foreignKeyName}"] = cached_property(createFkeyLambda(cls, foreignKeyName))
     
-    # attrs["authorizations"] = property(cache(lambda self: AuthorizationLoader()))
+    attrs["authorizations"] = cached_property(lambda self: createAuthorizationLoader())
     Loaders = type('Loaders', (), attrs)   
-    return Loaders()
+    return Loaders
+
+Loaders = createLoadersClass()
+
+def createLoaders(asyncSessionMaker):
+    return Loaders(asyncSessionMaker)
 
 
 def getUserFromInfo(info):
@@ -53,14 +507,23 @@ def getUserFromInfo(info):
     return result
 
 def getLoadersFromInfo(info):
+    """Vraci loadery pro zpracovavanou operaci. Dotazy (query) ctou z repliky, je-li v kontextu,
+    mutace (vcetne cteni jejich vysledku) pracuji vzdy s primarni databazi.
+    """
     # print("info", info)
     context = info.context
     # print("context", context)
     loaders = context.get("loaders", None)
     assert loaders is not None, f"'loaders' key missing in context"
+    if info.operation.operation == OperationType.QUERY:
+        return context.get("readLoaders", loaders)
     return loaders
 
-def createLoadersContext(asyncSessionMaker):
-    return {
+def createLoadersContext(asyncSessionMaker, readAsyncSessionMaker=None):
+    """readAsyncSessionMaker je SessionMaker repliky (jen pro cteni), pouziva se pro dotazy"""
+    result = {
         "loaders": createLoaders(asyncSessionMaker)
     }
+    if readAsyncSessionMaker is not None and readAsyncSessionMaker is not asyncSessionMaker:
+        result["readLoaders"] = createLoaders(readAsyncSessionMaker)
+    return result
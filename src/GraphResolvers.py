@@ -14,7 +14,7 @@ from uoishelpers.resolvers import (
 )
 from uoishelpers.resolvers import putSingleEntityToDb
 
-from gql_publications.DBDefinitions import BaseModel
+from src.DBDefinitions import BaseModel
 
 ###########################################################################################################################
 #
@@ -22,7 +22,7 @@ from gql_publications.DBDefinitions import BaseModel
 #
 ###########################################################################################################################
 
-from gql_publications.DBDefinitions import (
+from src.DBDefinitions import (
     BaseModel,
     PublicationModel,
     AuthorModel,
@@ -87,29 +87,60 @@ resolveSubjectsFroPublication = create1NGetter(
 )
 
 
-async def resolveUpdateAuthorOrder(session, id, author_id, order):
-    result = list(await resolveAuthorsForPublication(session), id)
-    sortedAuthors = sorted(result, key=lambda i: i["order"])
-
-    modifiedAuthor = {}
-    index = next(
-        (index for (index, d) in enumerate(sortedAuthors) if d["id"] == author_id), None
+import datetime
+from sqlalchemy import update, case
+
+async def resolveUpdateAuthorOrder(session, id, author_id, order, lastchange=None, extraValues={}):
+    """Presune autora author_id publikace id na pozici order, autori mezi starou a novou pozici
+    se posunou o jednu. Radky autoru publikace jsou nejdrive zamceny (SELECT ... FOR UPDATE, vzdy
+    ve stejnem poradi), zmena je pak provedena jednim UPDATE ... SET "order" = CASE ...
+    Je-li zadan lastchange, musi odpovidat presouvanemu autorovi (jako u update).
+    Vraci False, pokud autor neexistuje, nepatri k publikaci, nesouhlasi lastchange
+    nebo order je mimo rozsah 1 .. pocet autoru publikace.
+    """
+    statement = (
+        select(AuthorModel.id, AuthorModel.order, AuthorModel.lastchange)
+        .where(AuthorModel.publication_id == id)
+        .order_by(AuthorModel.id)
+        .with_for_update()
     )
-    modifiedAuthor = sortedAuthors.pop(index)
-
-    limitValue = modifiedAuthor["order"]
-    modifiedAuthor["order"] = order
-
-    for author in sortedAuthors:
-        if (author["order"] <= order) and (author["order"] >= limitValue):
-            author["order"] -= 1
-        elif (author["order"] >= order) and (author["order"] <= limitValue):
-            author["order"] += 1
-
-    sortedAuthors.append(modifiedAuthor)
-
+    rows = list((await session.execute(statement)).mappings())
+    moved = next((row for row in rows if row["id"] == author_id), None)
+    if moved is None or (lastchange is not None and moved["lastchange"] != lastchange) or not (1 <= order <= len(rows)):
+        await session.rollback()
+        return False
+
+    oldOrder = moved["order"]
+    if oldOrder is None:
+        statement = update(AuthorModel).where(AuthorModel.id == author_id)
+        statement = statement.values(order=order)
+    else:
+        shift = -1 if oldOrder < order else 1
+        statement = (
+            update(AuthorModel)
+            .where(AuthorModel.publication_id == id)
+            .where(AuthorModel.order.between(min(oldOrder, order), max(oldOrder, order)))
+            .values(order=case((AuthorModel.id == author_id, order), else_=AuthorModel.order + shift))
+        )
+    statement = statement.values(lastchange=datetime.datetime.now(), **extraValues)
+    await session.execute(statement.execution_options(synchronize_session=False))
     await session.commit()
-    return sortedAuthors
+    return True
+
+async def resolveMoveAuthor(session, author_id, order, lastchange=None, extraValues={}):
+    """Presune autora author_id na pozici order v jeho publikaci (viz resolveUpdateAuthorOrder).
+    Publikace autora je zjistena ve stejne transakci, ve ktere jsou radky zamceny,
+    resolveUpdateAuthorOrder ji pod zamkem znovu overi.
+    Vraci id publikace nebo None, pokud presun nebyl proveden.
+    """
+    statement = select(AuthorModel.publication_id).where(AuthorModel.id == author_id)
+    publication_id = (await session.execute(statement)).scalar_one_or_none()
+    if publication_id is None:
+        await session.rollback()
+        return None
+    moved = await resolveUpdateAuthorOrder(
+        session, publication_id, author_id, order, lastchange=lastchange, extraValues=extraValues)
+    return publication_id if moved else None
 
 
 ## PublicationType resolvers
@@ -26,7 +26,8 @@ from ._GraphResolvers import (
     resolve_created,
     resolve_lastchange,
     resolve_createdby,
-    resolve_changedby
+    resolve_changedby,
+    resolveDeferredColumn
 )
 
 from src.Dataloaders import getLoadersFromInfo, getUserFromInfo
@@ -56,8 +57,8 @@ class PublicationTypeGQLModel(BaseGQLModel):
     async def publications(
         self, info: strawberry.types.Info
     ) -> typing.List["PublicationGQLModel"]:
-        loader = PublicationGQLModel.getLoader(info)
-        result = await loader.filter_by()
+        loader = getLoadersFromInfo(info).PublicationModel_by_publication_type_id
+        result = await loader.load(self.id)
         return result
 
 @strawberry.federation.type(
@@ -77,16 +78,16 @@ class PublicationGQLModel(BaseGQLModel):
     changed_by = resolve_changedby
 
     @strawberry.field(description="""published year""")
-    def published_date(self) -> datetime.datetime:
-        return self.published_date
+    def published_date(self, info: strawberry.types.Info) -> datetime.datetime:
+        return resolveDeferredColumn(self, "published_date", PublicationGQLModel.getLoader(info))
 
     @strawberry.field(description="""place""")
-    def place(self) -> str:
-        return self.place
+    def place(self, info: strawberry.types.Info) -> str:
+        return resolveDeferredColumn(self, "place", PublicationGQLModel.getLoader(info))
 
     @strawberry.field(description="""reference""")
-    def reference(self) -> str:
-        return self.reference
+    def reference(self, info: strawberry.types.Info) -> str:
+        return resolveDeferredColumn(self, "reference", PublicationGQLModel.getLoader(info))
 
     @strawberry.field(description="""If a publication is valid""")
     def valid(self) -> bool:
@@ -98,8 +99,8 @@ class PublicationGQLModel(BaseGQLModel):
     async def authors(
         self, info: strawberry.types.Info
     ) -> typing.List["PublicationAuthorGQLModel"]:
-        loader = PublicationAuthorGQLModel.getLoader(info)
-        result = await loader.filter_by(publication_id=self.id)
+        loader = getLoadersFromInfo(info).AuthorModel_by_publication_id
+        result = await loader.load(self.id)
         return result
 
     @strawberry.field(description="""Publication type""")
@@ -111,8 +112,8 @@ class PublicationGQLModel(BaseGQLModel):
     @strawberry.field(description="""Subjects publication is linked to""")
     async def subjects(self, info: strawberry.types.Info) -> List["AcSubjectGQLModel"]:
         from .externals import AcSubjectGQLModel
-        loader = getLoadersFromInfo(info).SubjectModel
-        rows = await loader.filter_by(subject_id=self.id)
+        loader = getLoadersFromInfo(info).SubjectModel_by_publication_id
+        rows = await loader.load(self.id)
         awaitables = (AcSubjectGQLModel.resolve_reference(info, row.subject_id) for row in rows)
         return await asyncio.gather(*awaitables)
 
@@ -136,12 +137,12 @@ class PublicationAuthorGQLModel(BaseGQLModel):
     changed_by = resolve_changedby,
 
     @strawberry.field(description="""order in author list""")
-    def order(self) -> int:
-        return self.order
+    def order(self, info: strawberry.types.Info) -> int:
+        return resolveDeferredColumn(self, "order", PublicationAuthorGQLModel.getLoader(info))
 
     @strawberry.field(description="""share on publication""")
-    def share(self) -> float:
-        return self.share
+    def share(self, info: strawberry.types.Info) -> float:
+        return resolveDeferredColumn(self, "share", PublicationAuthorGQLModel.getLoader(info))
 
     @strawberry.field(description="""user""")
     async def user(self, info: strawberry.types.Info) -> Optional["UserGQLModel"]:
@@ -165,7 +166,7 @@ class PublicationAuthorGQLModel(BaseGQLModel):
 from dataclasses import dataclass
 from uoishelpers.resolvers import createInputs
 from typing import Optional
-from ._GraphResolvers import encapsulateInsert, encapsulateDelete, encapsulateUpdate
+from ._GraphResolvers import encapsulateInsert, encapsulateDelete, encapsulateUpdate, encapsulateInsertMany, encapsulateUpdateMany
 @createInputs
 @dataclass
 class PublicationInputWhereFilter:
@@ -211,17 +212,30 @@ async def publication_update(
 ) -> "PublicationResultGQLModel":
     return await encapsulateUpdate(info, PublicationGQLModel.getLoader(info), publication, PublicationResultGQLModel(id=publication.id, msg="ok"))
 
+@strawberry.field(description="""Updates many publications in one transaction, returns result for each item (in the same order).
+Item with outdated lastchange is not updated (fail).""")
+async def publication_update_many(
+    self, info: strawberry.types.Info, publications: List["PublicationUpdateGQLModel"]
+) -> List["PublicationResultGQLModel"]:
+    return await encapsulateUpdateMany(info, PublicationGQLModel.getLoader(info), publications, PublicationResultGQLModel)
+
 @strawberry.field(description="""Inserts publication data""")
 async def publication_insert(
     self, info: strawberry.types.Info, publication: "PublicationInsertGQLModel"
 ) -> "PublicationResultGQLModel":
     return await encapsulateInsert(info, PublicationGQLModel.getLoader(info), publication, PublicationResultGQLModel(id=publication.id, msg="ok"))
 
+@strawberry.field(description="""Inserts many publications in one transaction, returns result for each item (in the same order)""")
+async def publication_insert_many(
+    self, info: strawberry.types.Info, publications: List["PublicationInsertGQLModel"]
+) -> List["PublicationResultGQLModel"]:
+    return await encapsulateInsertMany(info, PublicationGQLModel.getLoader(info), publications, PublicationResultGQLModel)
+
 @strawberry.field(description="""Inserts publication data""")
 async def publication_delete(
     self, info: strawberry.types.Info, publication_id: IDType
 ) -> "PublicationResultGQLModel":
-    return await encapsulateDelete(info, PublicationGQLModel.getLoader(info), id, PublicationResultGQLModel(id=publication_id, msg="ok"))
+    return await encapsulateDelete(info, PublicationGQLModel.getLoader(info), publication_id, PublicationResultGQLModel(id=publication_id, msg="ok"))
 
 @createInputs
 @dataclass
@@ -231,6 +245,8 @@ class PublicationTypeInputWhereFilter:
 
 @strawberry.input(description="")
 class PublicationTypeUpdateGQLModel:
+    id: IDType
+    lastchange: datetime.datetime
     name: Optional[str] = None
     place: Optional[str] = None
     published_date: Optional[datetime.date] = None
@@ -276,7 +292,7 @@ async def publication_type_insert(
 async def publication_type_delete(
     self, info: strawberry.types.Info, publication_type_id: IDType
 ) -> "PublicationTypeResultGQLModel":
-    return await encapsulateDelete(info, PublicationTypeGQLModel.getLoader(info), id, PublicationTypeResultGQLModel(id=id, msg="ok"))
+    return await encapsulateDelete(info, PublicationTypeGQLModel.getLoader(info), publication_type_id, PublicationTypeResultGQLModel(id=publication_type_id, msg="ok"))
 
 @createInputs
 @dataclass
@@ -306,6 +322,12 @@ class PublicationAuthorInsertGQLModel:
     valid: Optional[bool] = strawberry.field(description="Indicates whether the data is valid or not (optional)", default=True)
     createdby: strawberry.Private[uuid.UUID] = None
 
+@strawberry.input(description="")
+class PublicationAuthorMoveGQLModel:
+    id: IDType = strawberry.field(description="The ID of the Author data")
+    lastchange: datetime.datetime = strawberry.field(description="Timestamp of last change")
+    order: int = strawberry.field(description="The new order of the Author in the publication")
+
 @strawberry.type(description="Result of mutation")
 class PublicationAuthorResultGQLModel:
     id: IDType = strawberry.field(description="The ID of the project", default=None)
@@ -323,12 +345,48 @@ async def publication_author_update(
     return await encapsulateUpdate(info, PublicationAuthorGQLModel.getLoader(info), author, PublicationAuthorResultGQLModel(id=author.id, msg="ok"))
 
 
+@strawberry.field(description="""Updates many authors in one transaction, returns result for each item (in the same order).
+Item with outdated lastchange is not updated (fail).""")
+async def publication_author_update_many(
+    self, info: strawberry.types.Info, authors: List[PublicationAuthorUpdateGQLModel]) -> List["AuthorResultGQLModel"]:
+    return await encapsulateUpdateMany(info, PublicationAuthorGQLModel.getLoader(info), authors, AuthorResultGQLModel)
+
+
 @strawberry.field(description="""Adds the authorship to the publication, Currently it does not check if the authorship exists.""")
 async def publication_author_insert(
     self, info: strawberry.types.Info, author: PublicationAuthorInsertGQLModel) -> "AuthorResultGQLModel":
     return await encapsulateInsert(info, PublicationAuthorGQLModel.getLoader(info), author, PublicationAuthorResultGQLModel(id=author.id, msg="ok"))
 
 
+@strawberry.field(description="""Adds many authorships in one transaction, returns result for each item (in the same order).
+Authorship of nonexisting publication is not inserted (fail).""")
+async def publication_author_insert_many(
+    self, info: strawberry.types.Info, authors: List[PublicationAuthorInsertGQLModel]) -> List["AuthorResultGQLModel"]:
+    from ..DBDefinitions import PublicationModel
+    return await encapsulateInsertMany(
+        info, PublicationAuthorGQLModel.getLoader(info), authors, AuthorResultGQLModel, 
+        foreignKeys={"publication_id": PublicationModel})
+
+
+@strawberry.field(description="""Moves the author to another position (order) in the publication, authors in between are shifted by one""")
+async def publication_author_move(
+    self, info: strawberry.types.Info, author: PublicationAuthorMoveGQLModel) -> "AuthorResultGQLModel":
+    from ..GraphResolvers import resolveMoveAuthor
+    loader = PublicationAuthorGQLModel.getLoader(info)
+    result = AuthorResultGQLModel(id=author.id, msg="fail")
+    user = getUserFromInfo(info)
+    async with loader.getAsyncSessionMaker()() as session:
+        publication_id = await resolveMoveAuthor(
+            session, author.id, author.order, 
+            lastchange=author.lastchange, extraValues={"changedby": user["id"]})
+    if publication_id is not None:
+        # zmenilo se poradi vice autoru publikace
+        loader.clear_all()
+        getLoadersFromInfo(info).AuthorModel_by_publication_id.clear(publication_id)
+        result.msg = "ok"
+    return result
+
+
 @strawberry.field(description="""Deletes the author""")
 async def publication_author_delete(
     self, info: strawberry.types.Info, id: IDType) -> "AuthorResultGQLModel":
@@ -343,13 +401,21 @@ async def publication_author_delete(
 ###########################################################################################################################
 from ..DBResolvers import DBResolvers
 from ._GraphPermissions import OnlyForAuthentized
+from ._GraphResolvers import createProjectedPageResolver, createByIdResolver, createCursorPageResolver
+
+# vnorena pole publikace nacitana spolecne s publikacemi (lookahead)
+publicationPrefetch = {
+    "authors": ("AuthorModel_by_publication_id", "id"),
+    "publicationtype": ("PublicationTypeModel", "publication_type_id"),
+    "subjects": ("SubjectModel_by_publication_id", "id"),
+}
 
 publication_by_id = strawberry.field(
     description="returns the publication",
     permission_classes=[
         OnlyForAuthentized
         ],
-    resolver=DBResolvers.PublicationModel.resolve_by_id(PublicationGQLModel)
+    resolver=createByIdResolver(PublicationGQLModel, prefetch=publicationPrefetch)
 )
 
 publication_page = strawberry.field(
@@ -357,7 +423,11 @@ publication_page = strawberry.field(
     permission_classes=[
         OnlyForAuthentized
     ],
-    resolver=DBResolvers.PublicationModel.resolve_page(PublicationGQLModel, WhereFilterModel=PublicationInputWhereFilter)
+    resolver=createProjectedPageResolver(
+        PublicationGQLModel, PublicationInputWhereFilter, 
+        deferrable=["published_date", "place", "reference"],
+        prefetch=publicationPrefetch
+    )
     )
 
 publication_type_by_id = strawberry.field(
@@ -377,6 +447,62 @@ publication_type_page = strawberry.field(
     )
 
 
+@strawberry.type(description="""Page of publications (keyset / cursor pagination)""")
+class PublicationCursorPageGQLModel:
+    items: typing.List[PublicationGQLModel] = strawberry.field(description="""Publications on this page""")
+    end_cursor: Optional[str] = strawberry.field(description="""Opaque cursor of the last item, use it as `after` for the next page""")
+    has_next_page: bool = strawberry.field(description="""True if there are more publications after this page""")
+
+publication_cursor_page = strawberry.field(
+    description="returns page of publications ordered by (lastchange, id), suitable for deep paging",
+    permission_classes=[
+        OnlyForAuthentized
+    ],
+    resolver=createCursorPageResolver(
+        PublicationGQLModel, PublicationCursorPageGQLModel, PublicationInputWhereFilter,
+        deferrable=["published_date", "place", "reference"],
+        prefetch=publicationPrefetch
+    )
+    )
+
+import types
+from sqlalchemy import or_, and_
+from ._GraphResolvers import encodeCursor, decodeCursor, checkPageSize
+from ..DBSearch import createSearchStatement
+
+@strawberry.field(
+    description="""Fulltext search of publications (name, place, reference), all words must match. 
+Results are ordered by relevance, use `endCursor` as `after` for the next page""",
+    permission_classes=[OnlyForAuthentized])
+async def publication_search(
+    self, info: strawberry.types.Info, 
+    query: str, 
+    limit: int = 20, 
+    after: Optional[str] = None
+) -> PublicationCursorPageGQLModel:
+    limit = checkPageSize(limit, "limit")
+    loader = PublicationGQLModel.getLoader(info)
+    async with loader.getAsyncSessionMaker()() as session:
+        statement, rank = createSearchStatement(session.bind.dialect.name, query)
+        if statement is None:
+            return PublicationCursorPageGQLModel(items=[], end_cursor=None, has_next_page=False)
+
+        DBModel = loader.getModel()
+        if after is not None:
+            [afterRank, afterId] = decodeCursor(after, [rank, DBModel.id])
+            statement = statement.where(or_(rank < afterRank, and_(rank == afterRank, DBModel.id > afterId)))
+        statement = statement.add_columns(rank).order_by(rank.desc(), DBModel.id).limit(limit + 1)
+        rows = (await session.execute(statement)).all()
+
+    items = [row for row, _ in rows[:limit]]
+    for row in items:
+        loader.registerResult(row)
+    endCursor = after
+    if len(items) > 0:
+        [lastRow, lastRank] = rows[len(items) - 1]
+        endCursor = encodeCursor(types.SimpleNamespace(rank=lastRank, id=lastRow.id), ["rank", "id"])
+    return PublicationCursorPageGQLModel(items=items, end_cursor=endCursor, has_next_page=len(rows) > limit)
+
 author_by_id = strawberry.field(
     description="returns the author",
     permission_classes=[
@@ -390,7 +516,27 @@ author_page = strawberry.field(
     permission_classes=[
         OnlyForAuthentized
     ],
-    resolver=DBResolvers.AuthorModel.resolve_page(PublicationAuthorGQLModel, WhereFilterModel=PublicationAuthorInputWhereFilter)
+    resolver=createProjectedPageResolver(
+        PublicationAuthorGQLModel, PublicationAuthorInputWhereFilter, 
+        deferrable=["order", "share"]
+    )
+    )
+
+@strawberry.type(description="""Page of authors (keyset / cursor pagination)""")
+class PublicationAuthorCursorPageGQLModel:
+    items: typing.List[PublicationAuthorGQLModel] = strawberry.field(description="""Authors on this page""")
+    end_cursor: Optional[str] = strawberry.field(description="""Opaque cursor of the last item, use it as `after` for the next page""")
+    has_next_page: bool = strawberry.field(description="""True if there are more authors after this page""")
+
+author_cursor_page = strawberry.field(
+    description="returns page of authors ordered by (lastchange, id), suitable for deep paging",
+    permission_classes=[
+        OnlyForAuthentized
+    ],
+    resolver=createCursorPageResolver(
+        PublicationAuthorGQLModel, PublicationAuthorCursorPageGQLModel, PublicationAuthorInputWhereFilter,
+        deferrable=["order", "share"]
+    )
     )
 
 
@@ -284,27 +284,39 @@ from src.Dataloaders import (
     )
 
 from strawberry.type import StrawberryList
+
+AUTHENTICATIONKEY = "authenticated"
+
+def getAuthenticationFromInfo(info):
+    """Rozhodnuti OnlyForAuthentized pro celou operaci. Pocita se jednou (DEMO, uzivatel z kontextu)
+    a je ulozeno v kontextu, kontroly jednotlivych poli jsou pak jen vyhledanim ve slovniku.
+    """
+    context = info.context
+    result = context.get(AUTHENTICATIONKEY, None)
+    if result is None:
+        if os.getenv("DEMO", None) == "True":
+            print("DEMO Enabled, not for production")
+            result = True
+        else:
+            user = getUserFromInfo(info)
+            result = (False if user is None else True)
+        context[AUTHENTICATIONKEY] = result
+    return result
+
 class OnlyForAuthentized(strawberry.permission.BasePermission):
     message = "User is not authenticated"
 
     async def has_permission(
         self, source, info: strawberry.types.Info, **kwargs
     ) -> bool:
-        if self.isDEMO:
-            print("DEMO Enabled, not for production")
+        if getAuthenticationFromInfo(info):
             return True
-        
+        # typ pole je zjistovan jen pri odmitnuti
         self.defaultResult = [] if info._field.type.__class__ == StrawberryList else None
-        user = getUserFromInfo(info)
-        return (False if user is None else True)
+        return False
     
     def on_unauthorized(self):
         return self.defaultResult
-        
-    @cached_property
-    def isDEMO(self):
-        DEMO = os.getenv("DEMO", None)
-        return DEMO == "True"
 
 # def createRoleGetter():
 #     allroles = []
@@ -339,62 +351,68 @@ class RBACPermission(BasePermission):
     #         cls._allRoles = result
     #     return result
 
+    _indexedRoleTypes = None
+
     @classmethod
     async def getAllRoles(cls, info: strawberry.types.Info):
+        "typy roli, tabulka roletypes je v UG, zde se pouziva rolelist (nacten z UG, v DEMO staticky)"
         if cls._allRoles is not None:
             return cls._allRoles
-        from ..DBDefinitions import RoleTypeModel, startEngine
-        from ..Dataloaders import getLoadersFromInfo
-        loader = getLoadersFromInfo(info).RoleTypeModel
-        roles = await loader.page(limit=1000)
-        
-        result = [{"id": r.id, "name": r.name, "name_en": r.name_en} for r in roles]
+        result = [{"id": r["id"], "name": r["name"], "name_en": r["name_en"]} for r in rolelist]
         assert len(result) > 1, f"are roletypes initialized {result}?"
         cls._allRoles = result
+        # index typu roli je sestaven jednou, ne pri kazdem cteni roli uzivatele
+        # klicem je id jako retezec, stejne jako roletype.id v odpovedich UG
+        cls._indexedRoleTypes = {f"{r['id']}": r for r in result}
 
         logging.info(f"loaded all roles {result}")
         return result
 
+    @classmethod
+    async def getIndexedRoleTypes(cls, info: strawberry.types.Info):
+        if cls._indexedRoleTypes is None:
+            await cls.getAllRoles(info)
+        return cls._indexedRoleTypes
+
+    @classmethod
+    async def fetchUserRoles(cls, info: strawberry.types.Info, user_id):
+        "reads roles of the user from UG (rolesOnUser), normalized by normalizeRole"
+        from src.Dataloaders import queryUG, normalizeRole, ROLEFRAGMENT
+        query = f"query ($id: UUID!) {{\n  roles: rolesOnUser(userId: $id) {{ ...role }}\n}}\n{ROLEFRAGMENT}"
+        data = await queryUG(query, {"id": f"{user_id}"})
+        return [normalizeRole(role) for role in (data.get("roles", None) or [])]
+
     async def getUserRoles(self, info: strawberry.types.Info):
-        from .roleGQLModel import RoleGQLModel
+        from src.Dataloaders import userRolesCache
         user = getUserFromInfo(info)
         userroles = user.get("roles")
         if userroles is None:
-            loader = RoleGQLModel.getLoader(info)
-            rolerows = await loader.filter_by(user_id=user["id"])
-            rolerows = list(rolerows)
-
-            ur = [
-                {
-                    "id": rolerow.id,
-                    "group_id": rolerow.group_id,
-                    "user_id": rolerow.user_id,
-                    "roletype_id": rolerow.roletype_id
-                } 
-                for rolerow in rolerows
-            ]
-            logging.info(f"user {user['id']} has roles {ur}")
-            allRoles = await RBACPermission.getAllRoles(info)
-            indexedRoleTypes = {r["id"]: r for r in allRoles}
-
-            userroles = [
-                {
-                    "id": rolerow.id,
-                    "group_id": rolerow.group_id,
-                    "user_id": rolerow.user_id,
-                    "roletype_id": rolerow.roletype_id,
-                    "type": indexedRoleTypes[rolerow.roletype_id]
-                } 
-                for rolerow in rolerows if indexedRoleTypes.get(rolerow.roletype_id, None) is not None]
-            # write back to context and cache it for next use in current request
-            logging.info(f"user {user['id']} has roles {userroles}")
+            indexedRoleTypes = await self.getIndexedRoleTypes(info)
+
+            async def load(user_id):
+                rolerows = await self.fetchUserRoles(info, user_id)
+                result = [
+                    {
+                        "id": rolerow["id"],
+                        "group_id": rolerow["group_id"],
+                        "user_id": rolerow["user_id"],
+                        "roletype_id": rolerow["roletype_id"],
+                        "type": indexedRoleTypes[f"{rolerow['roletype_id']}"]
+                    } 
+                    for rolerow in rolerows 
+                    if rolerow.get("valid", True) and indexedRoleTypes.get(f"{rolerow['roletype_id']}", None) is not None]
+                logging.info(f"user {user_id} has roles {result}")
+                return result
+
+            # sdilena cache mezi pozadavky (viz userRolesCache), role se meni v UG, zaznamy tedy jen expiruji (TTL)
+            userroles = await userRolesCache.get(user["id"], load)
             user["roles"] = userroles
         return userroles
         
 
     async def getRoles_(self, rbacobject: Any, info: strawberry.types.Info): 
         "returns roles related to source"
-        from .RBACObjectGQLModel import RBACObjectGQLModel
+        from .externals import RBACObjectGQLModel
         # assert hasattr(source, "rbacobject"), f"missing rbacobject on {source}"
         
         # rbacobject = source.rbacobject
@@ -411,14 +429,21 @@ class RBACPermission(BasePermission):
     
     async def getActiveRoles(self, rbacobject: Any, info: strawberry.types.Info):
         "returns roles related to source which has logged user"
-        from .RBACObjectGQLModel import RBACObjectGQLModel
-        
+        from .externals import RBACObjectGQLModel
+        if rbacobject is None:
+            return []
+        # loader (loaders.authorizations) spoji role vsech radku seznamu do jednoho dotazu
         authorizedroles = await RBACObjectGQLModel.resolve_roles(info=info, id=rbacobject)           
 
         user = getUserFromInfo(info)
         # logging.info(f"RolebasedPermission.authorized user {user}")
         user_id = user["id"]
-        usersrole = [r for r in authorizedroles if (r["user_id"] == user_id)]
+        # typ role (jako v getUserRoles), None pro typ mimo rolelist
+        indexedRoleTypes = await self.getIndexedRoleTypes(info)
+        usersrole = [
+            {**r, "type": indexedRoleTypes.get(f"{r['roletype']['id']}", None)}
+            for r in authorizedroles if (r["user_id"] == user_id)
+        ]
         return usersrole
     
     async def testIsAdmin(self, info: strawberry.types.Info, adminRoleNames=["administrátor"]):
@@ -431,7 +456,7 @@ class RBACPermission(BasePermission):
     async def testIsAllowed(self, info: strawberry.types.Info, rbacobject, allowedRolesNames = []):
         assert len(allowedRolesNames) > 0, "as allowedRolesNames is empty, this always fails"
         relatedRoles = await self.getActiveRoles(rbacobject, info)
-        allowedRoles = filter(lambda role: role["type"]["name"] in allowedRolesNames, relatedRoles)
+        allowedRoles = filter(lambda role: role["type"] is not None and role["type"]["name"] in allowedRolesNames, relatedRoles)
         return next(allowedRoles, None)
 
     async def resolveUserRole(self, info: strawberry.types.Info, rbacobject, adminRoleNames=["administrátor"], allowedRoleNames = []):
@@ -489,7 +514,7 @@ def InsertRBACPermission(roles: str = "", get_rbacobject = None):
             # self, source, **kwargs
         ) -> bool:
             rbacobject = get_rbacobject(source, info, **kwargs)
-            activeRoles = self.getActiveRoles(rbacobject, info)
+            activeRoles = await self.getActiveRoles(rbacobject, info)
             s = [r for r in activeRoles if (r["roletype"]["id"] in roleIdsNeeded)]           
             isAllowed = len(s) > 0
             return isAllowed
@@ -509,7 +534,7 @@ class AnyRolePermission(RBACPermission):
         # self, source, **kwargs
     ) -> bool:
         self.defaultResult = [] if info._field.type.__class__ == StrawberryList else None
-        activeRoles = self.getActiveRoles(source, info)
+        activeRoles = await self.getActiveRoles(getattr(source, "rbacobject", None), info)
         isAllowed = len(activeRoles) > 0
         return isAllowed
     
@@ -534,7 +559,7 @@ def RoleBasedPermission(roles: str = ""):
             # return False
             logging.info(f"has_permission {kwargs}")
             # assert False
-            activeRoles = self.getActiveRoles(source, info)
+            activeRoles = await self.getActiveRoles(getattr(source, "rbacobject", None), info)
             s = [r for r in activeRoles if (r["roletype"]["id"] in roleIdsNeeded)]           
             isAllowed = len(s) > 0
             return isAllowed
@@ -9,7 +9,8 @@ import inspect
 from functools import wraps
 from ._GraphPermissions import OnlyForAuthentized
 from typing import Optional
-from ..Dataloaders import getUserFromInfo
+from ..Dataloaders import getUserFromInfo, getLoadersFromInfo, invalidateSharedCaches
+from ..Dataloaders import prefetch as prefetchIntoLoader
 
 UserGQLModel = typing.Annotated["UserGQLModel", strawberry.lazy(".externals")]
 GroupGQLModel = typing.Annotated["GroupGQLModel", strawberry.lazy(".externals")]
@@ -123,11 +124,53 @@ resolve_cu_result_id = strawberry.field(graphql_type=uuid.UUID, description="pri
 resolve_cu_result_msg = strawberry.field(graphql_type=str, description="""Should be `ok` if descired state has been reached, otherwise `fail`.
 For update operation fail should be also stated when bad lastchange has been entered.""")
 
+import sqlalchemy
+
+def createUpdateIfUnchangedStatement(DBModel, entity):
+    """UPDATE ... WHERE id = :id AND lastchange = :lastchange RETURNING ..., None hodnoty nejsou zapsany (jako uoishelpers update)"""
+    values = {}
+    for column in DBModel.__table__.columns:
+        if column.key in ["id", "lastchange"]:
+            continue
+        value = getattr(entity, column.key, None)
+        if value is not None:
+            values[column.key] = value
+    values["lastchange"] = datetime.datetime.now()
+    return (
+        sqlalchemy.update(DBModel)
+        .where(DBModel.id == entity.id)
+        .where(DBModel.lastchange == entity.lastchange)
+        .values(values)
+        .returning(DBModel)
+        .execution_options(synchronize_session=False)
+    )
+
+async def updateIfUnchanged(loader, entity, session=None):
+    """Compare-and-swap update, jeden dotaz UPDATE ... WHERE id = :id AND lastchange = :lastchange RETURNING ...
+    misto nacteni radku, porovnani lastchange a zapisu (loader.update). Mezi ctenim a zapisem tak neni okno
+    pro soubeznou zmenu.
+    Bez session je dotaz proveden ve vlastni transakci, jinak v session (commit je na volajicim).
+    Vraci zmeneny radek, nebo None, pokud radek neexistuje nebo lastchange nesouhlasi.
+    """
+    statement = createUpdateIfUnchangedStatement(loader.getModel(), entity)
+    if session is None:
+        async with loader.getAsyncSessionMaker()() as session:
+            rows = await session.execute(statement)
+            row = rows.scalars().first()
+            await session.commit()
+    else:
+        rows = await session.execute(statement)
+        row = rows.scalars().first()
+    if row is not None:
+        loader.registerResult(row)
+    return row
+
 async def encapsulateUpdate(info, loader, entity, result):
     user = getUserFromInfo(info)
     entity.changedby = user["id"]
 
-    row = await loader.update(entity)
+    row = await updateIfUnchanged(loader, entity)
+    invalidateSharedCaches(loader.getModel(), entity.id)
     result.msg = "fail" if row is None else "ok"
     return result
 
@@ -136,6 +179,7 @@ async def encapsulateInsert(info, loader, entity, result):
     entity.createdby = user["id"]
     
     row = await loader.insert(entity)
+    invalidateSharedCaches(loader.getModel(), row.id)
     result.msg = "ok"
     result.id = result.id if result.id else row.id       
     return result   
@@ -149,8 +193,93 @@ async def encapsulateDelete(info, loader, id, result):
     #     result.msg='fail'
     # return result
     await loader.delete(id)
+    invalidateSharedCaches(loader.getModel(), id)
     return result
 
+from sqlalchemy import select, insert
+
+async def encapsulateInsertMany(info, loader, entities, resultType, foreignKeys={}, batchSize=1000):
+    """Vlozi entity v jedne transakci, kazda davka (batchSize polozek) je vlozena jednim hromadnym INSERT.
+    Vraci vysledek pro kazdou polozku ve stejnem poradi. Polozka, ktera neprojde kontrolou
+    (opakovane nebo jiz existujici id, neexistujici odkazovana entita), ma msg "fail" a neni vlozena.
+    foreignKeys je slovnik {jmeno atributu: DBModel}, hodnoty atributu musi v DBModel existovat.
+    """
+    user = getUserFromInfo(info)
+    DBModel = loader.getModel()
+    columnNames = [column.key for column in DBModel.__table__.columns]
+
+    rows = []
+    results = []
+    for entity in entities:
+        # stejne jako uoishelpers update, None hodnoty nejsou zapsany (uplatni se default)
+        row = {name: getattr(entity, name, None) for name in columnNames}
+        row = {name: value for name, value in row.items() if value is not None}
+        row["id"] = row.get("id", uuid.uuid4())
+        row["createdby"] = user["id"]
+        rows.append(row)
+        results.append(resultType(id=row["id"], msg="ok"))
+
+    seen = set()
+    for row, result in zip(rows, results):
+        if row["id"] in seen:
+            result.msg = "fail"
+        seen.add(row["id"])
+
+    asyncSessionMaker = loader.getAsyncSessionMaker()
+    async with asyncSessionMaker() as session:
+        async with session.begin():
+            for start in range(0, len(rows), batchSize):
+                batch = list(zip(rows[start:start + batchSize], results[start:start + batchSize]))
+                batch = [(row, result) for row, result in batch if result.msg == "ok"]
+
+                ids = [row["id"] for row, _ in batch]
+                existing = await session.execute(select(DBModel.id).where(DBModel.id.in_(ids)))
+                existing = set(existing.scalars())
+                for attributeName, ReferencedModel in foreignKeys.items():
+                    keys = {row[attributeName] for row, _ in batch if attributeName in row}
+                    found = await session.execute(select(ReferencedModel.id).where(ReferencedModel.id.in_(keys)))
+                    found = set(found.scalars())
+                    for row, result in batch:
+                        if attributeName in row and row[attributeName] not in found:
+                            result.msg = "fail"
+
+                values = []
+                for row, result in batch:
+                    if row["id"] in existing:
+                        result.msg = "fail"
+                    if result.msg == "ok":
+                        values.append(row)
+                # jeden INSERT ... VALUES (...), (...) pro kazdou sadu vyplnenych sloupcu (obvykle jedna)
+                groups = {}
+                for row in values:
+                    groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+                for group in groups.values():
+                    await session.execute(insert(DBModel).values(group))
+
+    for result in results:
+        if result.msg == "ok":
+            invalidateSharedCaches(DBModel, result.id)
+    return results
+
+async def encapsulateUpdateMany(info, loader, entities, resultType):
+    """Zmeni entity v jedne transakci, kazda polozka je compare-and-swap update (viz updateIfUnchanged).
+    Vraci vysledek pro kazdou polozku ve stejnem poradi, polozka s nesouhlasicim lastchange
+    (nebo neexistujici) ma msg "fail" a ostatni polozky jsou presto zapsany.
+    """
+    user = getUserFromInfo(info)
+    DBModel = loader.getModel()
+    results = []
+    async with loader.getAsyncSessionMaker()() as session:
+        async with session.begin():
+            for entity in entities:
+                entity.changedby = user["id"]
+                row = await updateIfUnchanged(loader, entity, session=session)
+                results.append(resultType(id=entity.id, msg="fail" if row is None else "ok"))
+
+    for result in results:
+        invalidateSharedCaches(DBModel, result.id)
+    return results
+
 # def createAttributeScalarResolver(
 #     scalarType: None = None,
 #     foreignKeyName: str = None,
@@ -239,4 +368,200 @@ def createRootResolver_by_id(scalarType: None, description="Retrieves item by it
     #     result = await loader.page(skip=skip, limit=limit, where=wf)
     #     return result
 
-    # return paged
\ No newline at end of file
+    # return paged
+
+from strawberry.types.nodes import SelectedField
+from sqlalchemy.orm import defer
+from uoishelpers.dataloaders import prepareSelect
+
+def flattenSelections(selections):
+    """Vraci vybrana pole (SelectedField), obsah fragmentu (FragmentSpread, InlineFragment) je rozbalen"""
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            yield from flattenSelections(selection.selections)
+
+def selectedFieldNames(info: strawberry.types.Info, scalarType, path=[]):
+    """Vraci (python) jmena poli scalarType, ktera jsou vyzadana v selection setu aktualniho pole, vcetne fragmentu.
+    path jsou GraphQL jmena poli, kterymi se ma k scalarType sestoupit (napr. ["items"] u strankovani kurzorem).
+    """
+    nameConverter = info.schema.config.name_converter
+    pythonNames = {
+        nameConverter.from_field(field): field.python_name 
+        for field in scalarType.__strawberry_definition__.fields
+    }
+    selections = [selection for field in info.selected_fields for selection in field.selections]
+    for name in path:
+        selections = [
+            selection
+            for field in flattenSelections(selections) if field.name == name
+            for selection in field.selections
+        ]
+    return {pythonNames.get(field.name, field.name) for field in flattenSelections(selections)}
+
+async def executeProjected(info: strawberry.types.Info, loader, statement, selected, deferrable=[], prefetch={}):
+    """Provede select nad entitami, sloupce z deferrable, ktere nejsou v selected, nenacita (viz resolveDeferredColumn).
+    Vnorena pole z prefetch jsou nactena v ramci stejne session (viz prefetchSelected).
+    Radky jsou jen castecne nactene, proto nejsou vkladany do id loaderu ani do sdilenych cache.
+    """
+    DBModel = loader.getModel()
+    deferred = [defer(getattr(DBModel, name)) for name in deferrable if name not in selected]
+    if deferred:
+        statement = statement.options(*deferred)
+
+    async with loader.getAsyncSessionMaker()() as session:
+        rows = await session.execute(statement)
+        rows = list(rows.scalars())
+        await prefetchSelected(info, session, rows, selected, prefetch)
+    return rows
+
+def resolveDeferredColumn(row, name, loader):
+    """Vraci hodnotu sloupce name.
+    Pokud sloupec nebyl nacten (byl odlozen projekci v page resolveru), vraci awaitable, 
+    ktery nacte celou entitu pres id loader.
+    """
+    if name in row.__dict__:
+        return row.__dict__[name]
+    async def loadFullRow():
+        fullRow = await loader.load(row.id)
+        return getattr(fullRow, name)
+    return loadFullRow()
+
+async def prefetchSelected(info: strawberry.types.Info, session, rows, selected, prefetch={}):
+    """Lookahead - pro vnorena pole z prefetch, ktera jsou v selection setu, nacte data pro vsechny rows 
+    jednim dotazem v ramci session a vlozi je do loaderu, ze kterych je ctou resolvery vnorenych poli.
+    prefetch je slovnik {jmeno pole: (jmeno loaderu, atribut radku dodavajici klic)}, napr.
+    {"authors": ("AuthorModel_by_publication_id", "id"), "publicationtype": ("PublicationTypeModel", "publication_type_id")}
+    """
+    loaders = getLoadersFromInfo(info)
+    for fieldName, (loaderName, keyName) in prefetch.items():
+        if fieldName not in selected:
+            continue
+        keys = {getattr(row, keyName) for row in rows}
+        keys.discard(None)
+        if keys:
+            await prefetchIntoLoader(session, getattr(loaders, loaderName), list(keys))
+
+def createByIdResolver(scalarType, prefetch={}):
+    """Obdoba DBResolvers.*.resolve_by_id, vnorena pole z prefetch nacita spolecne s entitou (viz prefetchSelected)"""
+    assert scalarType is not None
+
+    async def id_resolver(self, info: strawberry.types.Info, id: uuid.UUID) -> typing.Optional[scalarType]:
+        selected = selectedFieldNames(info, scalarType)
+        if prefetch and not selected.isdisjoint(prefetch.keys()):
+            loader = scalarType.getLoader(info)
+            async with loader.getAsyncSessionMaker()() as session:
+                rows = await session.execute(loader.getSelectStatement().filter_by(id=id))
+                rows = list(rows.scalars())
+                await prefetchSelected(info, session, rows, selected, prefetch)
+            for row in rows:
+                loader.prime(row.id, row)
+        return await scalarType.resolve_reference(info, id=id)
+
+    return id_resolver
+
+def createProjectedPageResolver(scalarType, whereFilterType, deferrable=[], prefetch={}):
+    """Obdoba DBResolvers.*.resolve_page. 
+    Sloupce z deferrable, ktere nejsou v selection setu, nejsou z databaze nacitany.
+    Pole scalarType nad temito sloupci musi pouzivat resolveDeferredColumn.
+    Vnorena pole z prefetch jsou nactena v ramci stejne session (viz prefetchSelected).
+    """
+    assert scalarType is not None
+    assert whereFilterType is not None
+
+    async def page_resolver(
+        self, info: strawberry.types.Info,
+        skip: Optional[int] = 0, limit: Optional[int] = 10,
+        where: Optional[whereFilterType] = None,
+        orderby: Optional[str] = None,
+        desc: Optional[bool] = None
+    ) -> typing.List[scalarType]:
+        loader = scalarType.getLoader(info)
+        DBModel = loader.getModel()
+        wheredict = None if where is None else strawberry.asdict(where)
+
+        statement = loader.getSelectStatement() if wheredict is None else prepareSelect(DBModel, wheredict)
+        statement = statement.offset(skip).limit(limit)
+        if orderby is not None:
+            column = getattr(DBModel, orderby, None)
+            if column is not None:
+                statement = statement.order_by(column.desc() if desc else column.asc())
+
+        selected = selectedFieldNames(info, scalarType)
+        return await executeProjected(info, loader, statement, selected, deferrable, prefetch)
+
+    return page_resolver
+
+
+import base64
+import json
+from sqlalchemy import tuple_
+
+MAXPAGESIZE = 1000
+
+def checkPageSize(value, name="first", maximum=MAXPAGESIZE):
+    """Overi velikost stranky zadanou klientem, musi byt alespon 1, vetsi hodnota je omezena na maximum"""
+    if value < 1:
+        raise ValueError(f"{name} must be at least 1")
+    return min(value, maximum)
+
+def encodeCursor(row, keyNames):
+    """Vytvori nepruhledny kurzor z hodnot klicovych sloupcu radku"""
+    values = [str(getattr(row, name)) for name in keyNames]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def decodeCursor(cursor, keyColumns):
+    """Vraci hodnoty klicovych sloupcu zakodovane v kurzoru (viz encodeCursor)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        assert len(values) == len(keyColumns)
+        return [
+            datetime.datetime.fromisoformat(value) if column.type.python_type is datetime.datetime else column.type.python_type(value)
+            for column, value in zip(keyColumns, values)
+        ]
+    except Exception as e:
+        raise ValueError(f"invalid cursor {cursor}") from e
+
+def createCursorPageResolver(scalarType, connectionType, whereFilterType, keyNames=["lastchange", "id"], deferrable=[], prefetch={}):
+    """Strankovani kurzorem (keyset, first / after) misto skip / limit.
+    Entity jsou razeny podle keyNames (posledni musi byt unikatni, typicky id), dalsi stranka navazuje 
+    podminkou (k1, k2) > (kurzor) nad indexem (k1, k2), hluboke strankovani tak neprochazi preskocene radky.
+    Pri razeni podle lastchange se zmenena entita presune na konec, export ji tedy nevynecha.
+    Radky s NULL v nekterem z keyNames nelze porovnat s kurzorem, strankovani je vynechava.
+    first je omezeno na MAXPAGESIZE.
+    connectionType je strawberry typ s poli items, end_cursor a has_next_page.
+    """
+    assert scalarType is not None
+    assert connectionType is not None
+    assert whereFilterType is not None
+
+    async def cursor_page_resolver(
+        self, info: strawberry.types.Info,
+        first: int = 10,
+        after: Optional[str] = None,
+        where: Optional[whereFilterType] = None
+    ) -> connectionType:
+        first = checkPageSize(first, "first")
+        loader = scalarType.getLoader(info)
+        DBModel = loader.getModel()
+        keyColumns = [getattr(DBModel, name) for name in keyNames]
+        wheredict = None if where is None else strawberry.asdict(where)
+
+        statement = loader.getSelectStatement() if wheredict is None else prepareSelect(DBModel, wheredict)
+        statement = statement.filter(*[column.is_not(None) for column in keyColumns if column.nullable])
+        if after is not None:
+            statement = statement.filter(tuple_(*keyColumns) > tuple_(*decodeCursor(after, keyColumns)))
+        # o jeden radek vic, abychom vedeli, zda existuje dalsi stranka
+        statement = statement.order_by(*keyColumns).limit(first + 1)
+
+        selected = selectedFieldNames(info, scalarType, path=["items"])
+        rows = await executeProjected(info, loader, statement, selected.union(keyNames), deferrable, prefetch)
+        items = rows[:first]
+        return connectionType(
+            items=items,
+            end_cursor=encodeCursor(items[-1], keyNames) if items else after,
+            has_next_page=len(rows) > first
+        )
+
+    return cursor_page_resolver
@@ -21,18 +21,24 @@ class Query:
     from .Others import (
         publication_by_id,
         publication_page,
+        publication_cursor_page,
+        publication_search,
         publication_type_by_id,
         publication_type_page,
         author_by_id,
-        author_page
+        author_page,
+        author_cursor_page
     )
 
     publication_by_id = publication_by_id
     publication_page = publication_page
+    publication_cursor_page = publication_cursor_page
+    publication_search = publication_search
     publication_type_by_id = publication_type_by_id
     publication_type_page = publication_type_page
     author_by_id = author_by_id
     author_page = author_page
+    author_cursor_page = author_cursor_page
 
 
 ###########################################################################################################################
@@ -48,11 +54,16 @@ class Query:
 class Mutation:
     from .Others import (
         publication_author_insert, 
+        publication_author_insert_many,
+        publication_author_move,
         publication_author_update, 
+        publication_author_update_many,
         publication_author_delete,
 
         publication_insert,
+        publication_insert_many,
         publication_update,
+        publication_update_many,
         publication_delete,
 
         publication_type_insert,
@@ -61,11 +72,16 @@ class Mutation:
     )
     
     publication_author_insert = publication_author_insert
+    publication_author_insert_many = publication_author_insert_many
+    publication_author_move = publication_author_move
     publication_author_update = publication_author_update
+    publication_author_update_many = publication_author_update_many
     publication_author_delete = publication_author_delete
 
     publication_insert = publication_insert
+    publication_insert_many = publication_insert_many
     publication_update = publication_update
+    publication_update_many = publication_update_many
     publication_delete = publication_delete
 
     publication_type_insert = publication_type_insert
@@ -27,9 +27,8 @@ class UserGQLModel:
     async def author_publications(
         self, info: strawberry.types.Info
     ) -> typing.List["PublicationAuthorGQLModel"]:
-        from .Others import PublicationAuthorGQLModel
-        loader = PublicationAuthorGQLModel.getLoader(info)
-        result = await loader.filter_by(user_id=self.id)
+        loader = getLoadersFromInfo(info).AuthorModel_by_user_id
+        result = await loader.load(self.id)
         return result
 
 @strawberry.federation.type(extend=True, keys=["id"])
@@ -56,9 +55,9 @@ class AcSubjectGQLModel:
 
     @strawberry.field(description="""linked publications""")
     async def publication(self, info: strawberry.types.Info) -> typing.List["PublicationGQLModel"]:
-        loader = getLoadersFromInfo(info).SubjectModel
+        loader = getLoadersFromInfo(info).SubjectModel_by_subject_id
         from .Others import PublicationGQLModel
-        rows = await loader.filter_by(subject_id=self.id)
+        rows = await loader.load(self.id)
         awaitables = (PublicationGQLModel.resolve_reference(info, row.publication_id) for row in rows)
         return await asyncio.gather(*awaitables)
 
@@ -67,8 +66,8 @@ class RBACObjectGQLModel:
     id: uuid.UUID = strawberry.federation.field(external=True)
     resolve_reference = resolve_reference
 
-    # @classmethod
-    # async def resolve_roles(cls, info: strawberry.types.Info, id: uuid.UUID):
-    #     loader = getLoadersFromInfo(info).authorizations
-    #     authorizedroles = await loader.load(id)
-    #     return authorizedroles
\ No newline at end of file
+    @classmethod
+    async def resolve_roles(cls, info: strawberry.types.Info, id: uuid.UUID):
+        loader = getLoadersFromInfo(info).authorizations
+        authorizedroles = await loader.load(id)
+        return authorizedroles
\ No newline at end of file
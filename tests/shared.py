@@ -9,27 +9,48 @@ import pytest
 
 # from ..uoishelpers.uuid import UUIDColumn
 
-from gql_publications.DBDefinitions import BaseModel
-from gql_publications.DBDefinitions import AuthorModel
-from gql_publications.DBDefinitions import PublicationModel, PublicationTypeModel, PublicationCategoryModel
-
-async def prepare_in_memory_sqllite():
+from src.DBDefinitions import BaseModel
+from src.DBDefinitions import AuthorModel
+from src.DBDefinitions import PublicationModel, PublicationTypeModel, PublicationCategoryModel, SubjectModel
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import now
+
+@compiles(now, "sqlite")
+def sqliteNow(element, compiler, **kwargs):
+    """sqlite uklada casy jako text, CURRENT_TIMESTAMP je bez zlomku sekund, parametry (sqlalchemy) ale
+    s mikrosekundami. now() proto vraci stejny tvar jako parametry, lastchange (server_default) je tak
+    mozne porovnavat presne jako na postgres.
+    """
+    return "(STRFTIME('%Y-%m-%d %H:%M:%f000', 'NOW'))"
+
+async def prepare_in_memory_sqllite(statements=None):
+    """statements - je-li dan list, jsou do nej zapisovany vsechny provedene SQL prikazy"""
     from sqlalchemy.ext.asyncio import create_async_engine
     from sqlalchemy.ext.asyncio import AsyncSession
     from sqlalchemy.orm import sessionmaker
 
     asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
     # asyncEngine = create_async_engine("sqlite+aiosqlite:///data.sqlite")
+    if statements is not None:
+        @sqlalchemy.event.listens_for(asyncEngine.sync_engine, "before_cursor_execute")
+        def collect(conn, cursor, statement, *args):
+            statements.append(statement)
+
     async with asyncEngine.begin() as conn:
         await conn.run_sync(BaseModel.metadata.create_all)
 
+    # FTS5 tabulka pro publicationSearch
+    from src.DBSearch import ensureSearch
+    await ensureSearch(asyncEngine)
+
     async_session_maker = sessionmaker(
         asyncEngine, expire_on_commit=False, class_=AsyncSession
     )
 
     return async_session_maker
 
-from gql_publications.DBFeeder import get_demodata
+from src.DBFeeder import get_demodata
 
 async def prepare_demodata(async_session_maker):
     data = get_demodata()
@@ -42,17 +63,19 @@ async def prepare_demodata(async_session_maker):
             AuthorModel,
             PublicationModel, 
             PublicationTypeModel, 
-            PublicationCategoryModel
+            PublicationCategoryModel,
+            SubjectModel
         ],
         data,
     )
 
 
-from gql_publications.Dataloaders import createLoaders
+from src.Dataloaders import createLoadersContext
 
 
 async def createContext(asyncSessionMaker):
     return {
         "asyncSessionMaker": asyncSessionMaker,
-        "all": await createLoaders(asyncSessionMaker),
+        **createLoadersContext(asyncSessionMaker),
+        "user": {"id": "2d9dc5ca-a4a2-11ed-b9df-0242ac120003"},
     }
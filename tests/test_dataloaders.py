@@ -0,0 +1,544 @@
+import asyncio
+import pytest
+
+from src.DBDefinitions import PublicationModel, PublicationTypeModel
+from src.DBFeeder import get_demodata
+from src.Dataloaders import createLoaders
+
+from shared import prepare_in_memory_sqllite, prepare_demodata
+
+
+@pytest.mark.asyncio
+async def test_fkey_loader_batches_keys():
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+
+    publicationIds = [row["id"] for row in data["publications"]]
+    loaders = createLoaders(async_session_maker)
+
+    statements.clear()
+    results = await asyncio.gather(*(loaders.AuthorModel_by_publication_id.load(id) for id in publicationIds))
+    assert len(statements) == 1
+
+    for publicationId, rows in zip(publicationIds, results):
+        expected = [row["id"] for row in data["publication_authors"] if row["publication_id"] == publicationId]
+        assert sorted(row.id for row in rows) == sorted(expected)
+
+    # radky jsou vlozeny i do id loaderu, dalsi dotaz do db neni potreba
+    statements.clear()
+    author = await loaders.AuthorModel.load(data["publication_authors"][0]["id"])
+    assert author is not None
+    assert len(statements) == 0
+
+
+from src.Dataloaders import lookupTables
+
+
+@pytest.mark.asyncio
+async def test_lookup_tables_shared_between_requests():
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+    typeId = data["publicationtypes"][0]["id"]
+
+    await lookupTables.preload(async_session_maker)
+
+    statements.clear()
+    for _ in range(3):
+        # kazdy pozadavek ma sve loadery, ciselnik je ale sdileny
+        row = await createLoaders(async_session_maker).PublicationTypeModel.load(typeId)
+        assert row.id == typeId
+    assert len(statements) == 0
+
+    lookupTables.invalidate(PublicationTypeModel)
+    row = await createLoaders(async_session_maker).PublicationTypeModel.load(typeId)
+    assert row.id == typeId
+    assert len(statements) == 1
+
+
+from src.Dataloaders import entityCache, invalidateSharedCaches
+
+
+@pytest.mark.asyncio
+async def test_entity_cache_validated_by_lastchange():
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+    publicationId = data["publications"][0]["id"]
+    entityCache.clear()
+
+    row = await createLoaders(async_session_maker).PublicationModel.load(publicationId)
+    assert row.id == publicationId
+    assert entityCache.stats()["entries"] == 1
+
+    # dalsi pozadavek overi jen lastchange
+    hits = entityCache.hits
+    statements.clear()
+    cached = await createLoaders(async_session_maker).PublicationModel.load(publicationId)
+    assert cached is row
+    assert entityCache.hits == hits + 1
+    assert len(statements) == 1
+    assert "reference" not in statements[0]
+
+    # zmena v databazi (napr. jinym procesem) je rozpoznana
+    import datetime
+    from sqlalchemy import update
+    async with async_session_maker() as session:
+        statement = update(PublicationModel).where(PublicationModel.id == publicationId)
+        await session.execute(statement.values(name="changed", lastchange=datetime.datetime.now()))
+        await session.commit()
+    fresh = await createLoaders(async_session_maker).PublicationModel.load(publicationId)
+    assert fresh.name == "changed"
+
+    invalidateSharedCaches(PublicationModel, publicationId)
+    assert entityCache.stats()["entries"] == 0
+
+
+def test_entity_cache_evicts_lru():
+    from src.Dataloaders import EntityCache
+
+    class Row:
+        __table__ = PublicationModel.__table__
+        def __init__(self, id):
+            for column in self.__table__.columns:
+                setattr(self, column.key, None)
+            self.id = id
+
+    cache = EntityCache([PublicationModel], maxEntries=2)
+    for id in range(3):
+        cache.put(PublicationModel, Row(id))
+    assert cache.peek(PublicationModel, 0) is None
+    assert cache.peek(PublicationModel, 2) is not None
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_entity_cache_metrics_published():
+    from prometheus_client import REGISTRY
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+    publicationIds = [row["id"] for row in data["publications"]][:2]
+    entityCache.clear()
+    table = PublicationModel.__tablename__
+    misses = sample("entity_cache_lookups_total", model=table, result="misses")
+    hits = sample("entity_cache_lookups_total", model=table, result="hits")
+    evictions = sample("entity_cache_evictions_total", model=table)
+
+    maxEntries = entityCache.maxEntries
+    entityCache.maxEntries = 1
+    try:
+        await createLoaders(async_session_maker).PublicationModel.load(publicationIds[0])
+        await createLoaders(async_session_maker).PublicationModel.load(publicationIds[0])
+        await createLoaders(async_session_maker).PublicationModel.load(publicationIds[1])
+    finally:
+        entityCache.maxEntries = maxEntries
+
+    assert sample("entity_cache_lookups_total", model=table, result="misses") == misses + 2
+    assert sample("entity_cache_lookups_total", model=table, result="hits") == hits + 1
+    assert sample("entity_cache_evictions_total", model=table) == evictions + 1
+    assert sample("entity_cache_entries") == 1
+    assert sample("entity_cache_bytes") == entityCache.stats()["bytes"]
+    entityCache.clear()
+    assert sample("entity_cache_entries") == 0
+
+
+@pytest.mark.asyncio
+async def test_page_loads_only_selected_columns(monkeypatch):
+    monkeypatch.setenv("DEMO", "True")
+    from src.Dataloaders import createLoadersContext
+    from src.GraphTypeDefinitions import schema
+
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    entityCache.clear()
+
+    statements.clear()
+    resp = await schema.execute("{ publicationPage { id name } }", context_value=createLoadersContext(async_session_maker))
+    assert resp.errors is None
+    assert len(statements) == 1
+    assert "reference" not in statements[0]
+
+    query = "{ publicationPage { id ...R } } fragment R on PublicationGQLModel { reference }"
+    statements.clear()
+    resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker))
+    assert resp.errors is None
+    assert "reference" in statements[0]
+    data = get_demodata()
+    assert [row["reference"] for row in resp.data["publicationPage"]] == [row["reference"] for row in data["publications"]]
+
+
+@pytest.mark.asyncio
+async def test_page_prefetches_nested_selections(monkeypatch):
+    monkeypatch.setenv("DEMO", "True")
+    from src.Dataloaders import createLoadersContext
+    from src.GraphTypeDefinitions import schema
+
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    await lookupTables.preload(async_session_maker)
+
+    query = "{ publicationPage { name publicationtype { name } authors { order share user { id } } } }"
+    statements.clear()
+    resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker))
+    assert resp.errors is None
+    # publikace a autori, typy jsou v lookupTables
+    assert len(statements) == 2
+
+    data = get_demodata()
+    publication = data["publications"][0]
+    authors = [row for row in data["publication_authors"] if row["publication_id"] == publication["id"]]
+    assert len(resp.data["publicationPage"][0]["authors"]) == len(authors)
+
+
+@pytest.mark.asyncio
+async def test_cursor_page_walks_all_publications(monkeypatch):
+    monkeypatch.setenv("DEMO", "True")
+    from src.Dataloaders import createLoadersContext
+    from src.GraphTypeDefinitions import schema
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+    # vsechny publikace maji stejny lastchange, poradi na strankach urcuje id
+    import datetime
+    from sqlalchemy import update
+    async with async_session_maker() as session:
+        await session.execute(update(PublicationModel).values(lastchange=datetime.datetime(2024, 1, 1)))
+        await session.commit()
+
+    query = """query($after: String) { 
+        publicationCursorPage(first: 2, after: $after) { items { id } endCursor hasNextPage } 
+    }"""
+
+    ids = []
+    after = None
+    while True:
+        resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker), variable_values={"after": after})
+        assert resp.errors is None
+        page = resp.data["publicationCursorPage"]
+        ids.extend(item["id"] for item in page["items"])
+        after = page["endCursor"]
+        if not page["hasNextPage"]:
+            break
+
+    data = get_demodata()
+    assert sorted(ids) == sorted(f'{row["id"]}' for row in data["publications"])
+
+    resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker), variable_values={"after": "nonsense"})
+    assert resp.errors is not None
+
+
+@pytest.mark.asyncio
+async def test_cursor_page_skips_null_keys_and_checks_first(monkeypatch):
+    monkeypatch.setenv("DEMO", "True")
+    import datetime
+    from sqlalchemy import update
+    from src.Dataloaders import createLoadersContext
+    from src.GraphTypeDefinitions import schema
+    from src.GraphTypeDefinitions._GraphResolvers import MAXPAGESIZE, checkPageSize
+
+    assert checkPageSize(MAXPAGESIZE * 10) == MAXPAGESIZE
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+    nullId = data["publications"][1]["id"]
+    async with async_session_maker() as session:
+        await session.execute(update(PublicationModel).values(lastchange=datetime.datetime(2024, 1, 1)))
+        await session.execute(update(PublicationModel).where(PublicationModel.id == nullId).values(lastchange=None))
+        await session.commit()
+
+    query = """query($first: Int!, $after: String) { 
+        publicationCursorPage(first: $first, after: $after) { items { id } endCursor hasNextPage } 
+    }"""
+
+    ids = []
+    after = None
+    while True:
+        resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker), variable_values={"first": 1, "after": after})
+        assert resp.errors is None
+        page = resp.data["publicationCursorPage"]
+        ids.extend(item["id"] for item in page["items"])
+        after = page["endCursor"]
+        if not page["hasNextPage"]:
+            break
+    # radek s NULL lastchange neni strankovan, ostatni projdou prave jednou
+    assert sorted(ids) == sorted(f'{row["id"]}' for row in data["publications"] if row["id"] != nullId)
+
+    for first in [0, -1, None]:
+        resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker), variable_values={"first": first})
+        assert resp.errors is not None
+
+    resp = await schema.execute(query, context_value=createLoadersContext(async_session_maker), variable_values={"first": MAXPAGESIZE * 10})
+    assert resp.errors is None
+    assert len(resp.data["publicationCursorPage"]["items"]) == len(ids)
+
+
+@pytest.mark.asyncio
+async def test_queries_read_replica_mutations_primary(monkeypatch):
+    monkeypatch.setenv("DEMO", "True")
+    from sqlalchemy import update
+    from src.GraphTypeDefinitions import schema
+
+    primary = await prepare_in_memory_sqllite()
+    await prepare_demodata(primary)
+    replica = await prepare_in_memory_sqllite()
+    await prepare_demodata(replica)
+    publication = get_demodata()["publications"][0]
+    async with replica() as session:
+        await session.execute(update(PublicationModel).where(PublicationModel.id == publication["id"]).values(name="replica"))
+        await session.commit()
+    entityCache.clear()
+
+    def createContextWithReplica():
+        from src.Dataloaders import createLoadersContext
+        return {**createLoadersContext(primary, replica), "user": {"id": "2d9dc5ca-a4a2-11ed-b9df-0242ac120003"}}
+
+    query = "query($id: UUID!) { publicationById(id: $id) { name lastchange } }"
+    resp = await schema.execute(query, context_value=createContextWithReplica(), variable_values={"id": f'{publication["id"]}'})
+    assert resp.errors is None
+    assert resp.data["publicationById"]["name"] == "replica"
+
+    async with primary() as session:
+        row = await session.get(PublicationModel, publication["id"])
+        lastchange = row.lastchange
+    query = """mutation($id: UUID!, $lastchange: DateTime!) { 
+        publicationUpdate(publication: {id: $id, lastchange: $lastchange, reference: "changed"}) { 
+            msg publication { name reference } 
+        } 
+    }"""
+    variables = {"id": f'{publication["id"]}', "lastchange": lastchange.isoformat()}
+    resp = await schema.execute(query, context_value=createContextWithReplica(), variable_values=variables)
+    assert resp.errors is None
+    result = resp.data["publicationUpdate"]
+    assert result["msg"] == "ok"
+    # vysledek mutace je cten z primarni databaze
+    assert result["publication"] == {"name": publication["name"], "reference": "changed"}
+
+
+import asyncio
+import types
+import uuid
+
+from src.Dataloaders import UserRolesCache, userRolesCache, invalidateUserRoles
+
+
+@pytest.mark.asyncio
+async def test_user_roles_cache():
+    cache = UserRolesCache(ttl=60, negativeTtl=0, maxEntries=2)
+    calls = []
+
+    async def load(userId):
+        calls.append(userId)
+        await asyncio.sleep(0.01)
+        return [] if userId == "nobody" else [{"id": userId}]
+
+    # soubezna cteni jednoho uzivatele vedou k jednomu nacteni
+    results = await asyncio.gather(*[cache.get("a", load) for _ in range(5)])
+    assert results == [[{"id": "a"}]] * 5
+    assert calls == ["a"]
+    assert await cache.get("a", load) == [{"id": "a"}]
+    assert calls == ["a"]
+
+    # uzivatel bez roli je drzen jen negativeTtl
+    assert await cache.get("nobody", load) == []
+    assert await cache.get("nobody", load) == []
+    assert calls == ["a", "nobody", "nobody"]
+
+    # omezeni poctu zaznamu a invalidace
+    await cache.get("b", load)
+    await cache.get("c", load)
+    assert cache.stats()["entries"] == 2
+    cache.invalidate("c")
+    await cache.get("c", load)
+    assert calls[-1] == "c" and calls.count("c") == 2
+
+
+@pytest.mark.asyncio
+async def test_rbac_user_roles_shared_between_requests():
+    from src.GraphTypeDefinitions._GraphPermissions import RBACPermission
+
+    roleTypeId = uuid.uuid4()
+    userId = uuid.uuid4()
+    fetched = []
+
+    class Permission(RBACPermission):
+        _allRoles = [{"id": roleTypeId, "name": "administrátor", "name_en": "administrator"}]
+        _indexedRoleTypes = {f"{roleTypeId}": _allRoles[0]}
+
+        @classmethod
+        async def fetchUserRoles(cls, info, user_id):
+            fetched.append(user_id)
+            return [{"id": uuid.uuid4(), "group_id": None, "user_id": user_id, "roletype_id": f"{roleTypeId}"}]
+
+    invalidateUserRoles()
+    for _ in range(3):
+        # kazdy pozadavek ma vlastni kontext
+        info = types.SimpleNamespace(context={"user": {"id": f"{userId}"}})
+        assert await Permission().testIsAdmin(info)
+    assert fetched == [userId]
+
+    invalidateUserRoles(userId)
+    await Permission().getUserRoles(info)
+    assert fetched == [userId, userId]
+    invalidateUserRoles()
+
+
+@pytest.mark.asyncio
+async def test_only_for_authentized_decided_once_per_operation(monkeypatch):
+    from src.GraphTypeDefinitions import _GraphPermissions
+    from src.GraphTypeDefinitions._GraphPermissions import OnlyForAuthentized
+
+    monkeypatch.setenv("DEMO", "False")
+    calls = []
+    getUserFromInfo = _GraphPermissions.getUserFromInfo
+    monkeypatch.setattr(_GraphPermissions, "getUserFromInfo", lambda info: calls.append(info) or getUserFromInfo(info))
+
+    context = {"user": {"id": f"{uuid.uuid4()}"}}
+    for _ in range(10):
+        info = types.SimpleNamespace(context=context, _field=None)
+        assert await OnlyForAuthentized().has_permission(None, info)
+    assert len(calls) == 1
+    assert context[_GraphPermissions.AUTHENTICATIONKEY] is True
+
+
+@pytest.mark.asyncio
+async def test_rbac_object_roles_batched():
+    from graphql import OperationType
+    from src.Dataloaders import createLoaders, createAuthorizationLoader, createRbacObjectRolesQuery
+    from src.GraphTypeDefinitions._GraphPermissions import RoleBasedPermission, AnyRolePermission, roleIndex
+
+    assert "$id2: UUID!" in createRbacObjectRolesQuery(3)
+
+    userId = uuid.uuid4()
+    rbacobjects = [uuid.uuid4() for _ in range(10)]
+    batches = []
+
+    async def fetchRoles(keys):
+        batches.append(keys)
+        # uzivatel je administratorem jen u sudych objektu
+        return [
+            [{"user_id": userId, "roletype": {"id": roleIndex["administrator"]}}] if rbacobjects.index(key) % 2 == 0 else []
+            for key in keys
+        ]
+
+    loaders = createLoaders(None)
+    loaders.authorizations = createAuthorizationLoader(fetchRoles)
+    info = types.SimpleNamespace(
+        context={"loaders": loaders, "user": {"id": f"{userId}"}},
+        operation=types.SimpleNamespace(operation=OperationType.QUERY),
+        _field=types.SimpleNamespace(type=None)
+    )
+    sources = [types.SimpleNamespace(rbacobject=rbacobject) for rbacobject in rbacobjects]
+
+    permission = RoleBasedPermission("administrator")
+    allowed = await asyncio.gather(*[permission().has_permission(source, info) for source in sources])
+    assert allowed == [index % 2 == 0 for index in range(10)]
+    assert batches == [rbacobjects]
+
+    # role jsou drzeny po dobu pozadavku
+    allowed = await asyncio.gather(*[AnyRolePermission().has_permission(source, info) for source in sources])
+    assert allowed == [index % 2 == 0 for index in range(10)]
+    assert len(batches) == 1
+
+    # role vztazene k rbacobject maji typ, podle jeho jmena rozhoduje testIsAllowed
+    roles = await asyncio.gather(*[
+        AnyRolePermission().resolveUserRole(info, rbacobject, adminRoleNames=[], allowedRoleNames=["administrátor"])
+        for rbacobject in rbacobjects
+    ])
+    assert [role is not None for role in roles] == [index % 2 == 0 for index in range(10)]
+    assert roles[0]["type"]["name_en"] == "administrator"
+    assert await AnyRolePermission().testIsAllowed(info, rbacobjects[0], ["děkan"]) is None
+
+
+@pytest.mark.asyncio
+async def test_rbac_object_roles_fetched_over_shared_session(monkeypatch):
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from src.Dataloaders import fetchRbacObjectRoles, getUGSession, closeUGSession, UGRequestError
+
+    userId = uuid.uuid4()
+    rbacobject = uuid.uuid4()
+    responses = []
+
+    async def handler(request):
+        body = await request.json()
+        assert body["variables"] == {"id0": f"{rbacobject}"}
+        return responses.pop(0)
+
+    app = web.Application()
+    app.router.add_post("/gql", handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        monkeypatch.delenv("GQLUG_ENDPOINT_URL", raising=False)
+        with pytest.raises(UGRequestError):
+            await fetchRbacObjectRoles([rbacobject])
+
+        monkeypatch.setenv("GQLUG_ENDPOINT_URL", f"{server.make_url('/gql')}")
+        role = {"id": "r", "valid": True, "roletype": {"id": "t"}, "user": {"id": f"{userId}"}, "group": None}
+        responses.append(web.json_response({"data": {"user0": [role], "group0": []}}))
+        session = getUGSession()
+        [roles] = await fetchRbacObjectRoles([rbacobject])
+        assert roles[0]["user_id"] == userId and roles[0]["roletype_id"] == "t"
+        assert getUGSession() is session
+
+        responses.append(web.json_response({"errors": [{"message": "denied"}]}))
+        with pytest.raises(UGRequestError):
+            await fetchRbacObjectRoles([rbacobject])
+        responses.append(web.Response(status=500))
+        with pytest.raises(UGRequestError):
+            await fetchRbacObjectRoles([rbacobject])
+        assert getUGSession() is session
+    finally:
+        await closeUGSession()
+        await server.close()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_rbac_user_roles_read_from_ug(monkeypatch):
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from src.Dataloaders import closeUGSession
+    from src.GraphTypeDefinitions._GraphPermissions import RBACPermission, roleIndex
+
+    userId = uuid.uuid4()
+    queries = []
+
+    async def handler(request):
+        body = await request.json()
+        queries.append(body)
+        role = {"valid": True, "roletype": {"id": roleIndex["administrator"]}, "user": {"id": body["variables"]["id"]}, "group": {"id": "g"}}
+        expired = {**role, "valid": False, "roletype": {"id": roleIndex["dean"]}}
+        return web.json_response({"data": {"roles": [{**role, "id": "r1"}, {**expired, "id": "r2"}]}})
+
+    app = web.Application()
+    app.router.add_post("/gql", handler)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setenv("GQLUG_ENDPOINT_URL", f"{server.make_url('/gql')}")
+    invalidateUserRoles()
+    try:
+        info = types.SimpleNamespace(context={"user": {"id": f"{userId}"}})
+        roles = await RBACPermission().getUserRoles(info)
+        assert [role["id"] for role in roles] == ["r1"]
+        assert roles[0]["user_id"] == userId
+        assert await RBACPermission().testIsAdmin(types.SimpleNamespace(context={"user": {"id": f"{userId}"}}))
+        assert len(queries) == 1
+        assert "rolesOnUser" in queries[0]["query"]
+    finally:
+        invalidateUserRoles()
+        await closeUGSession()
+        await server.close()
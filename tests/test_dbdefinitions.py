@@ -9,9 +9,9 @@ import pytest
 
 # from ..uoishelpers.uuid import UUIDColumn
 
-from gql_publications.DBDefinitions import BaseModel
-from gql_publications.DBDefinitions import AuthorModel
-from gql_publications.DBDefinitions import PublicationModel, PublicationTypeModel, PublicationCategoryModel
+from src.DBDefinitions import BaseModel
+from src.DBDefinitions import AuthorModel
+from src.DBDefinitions import PublicationModel, PublicationTypeModel, PublicationCategoryModel
 
 from shared import prepare_demodata, prepare_in_memory_sqllite, get_demodata
 
@@ -23,7 +23,7 @@ async def test_table_users_feed():
 
 
 
-from gql_publications.DBDefinitions import ComposeConnectionString
+from src.DBDefinitions import ComposeConnectionString
 
 
 def test_connection_string():
@@ -33,7 +33,7 @@ def test_connection_string():
     assert "@" in connectionString
 
 
-from gql_publications.DBDefinitions import UUIDColumn
+from src.DBDefinitions import UUIDColumn
 
 
 def test_connection_uuidcolumn():
@@ -42,7 +42,7 @@ def test_connection_uuidcolumn():
     assert col is not None
 
 
-from gql_publications.DBDefinitions import startEngine
+from src.DBDefinitions import startEngine
 
 
 @pytest.mark.asyncio
@@ -53,3 +53,98 @@ async def test_table_start_engine():
     )
 
     assert async_session_maker is not None
+
+
+from src.DBDefinitions import ComposeEngineOptions
+
+
+def test_engine_options(monkeypatch):
+    assert ComposeEngineOptions() == {}
+    monkeypatch.setenv("POOL_SIZE", "20")
+    monkeypatch.setenv("POOL_PRE_PING", "True")
+    monkeypatch.setenv("POOL_TIMEOUT", "2.5")
+    assert ComposeEngineOptions() == {"pool_size": 20, "pool_pre_ping": True, "pool_timeout": 2.5}
+
+
+@pytest.mark.asyncio
+async def test_start_engine_pool_metrics(tmp_path):
+    from src.DBMetrics import InstrumentedAsyncAdaptedQueuePool
+    from prometheus_client import REGISTRY
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"pool": "metrics"}) or 0
+
+    connectionString = f"sqlite+aiosqlite:///{tmp_path / 'pool.sqlite'}"
+    async_session_maker = await startEngine(
+        connectionString, makeDrop=True, makeUp=True, poolName="metrics",
+        engineOptions={"poolclass": InstrumentedAsyncAdaptedQueuePool, "pool_size": 1, "max_overflow": 0, "pool_pre_ping": True}
+    )
+    checkedOut = sample("db_pool_checked_out_connections")
+    checkouts = sample("db_pool_checkout_seconds_count")
+    async with async_session_maker() as session:
+        await session.execute(sqlalchemy.text("select 1"))
+        assert sample("db_pool_checked_out_connections") == checkedOut + 1
+        # volne spojeni, nikdo neceka
+        assert sample("db_pool_waiters") == 0
+
+        # pool je vycerpan, druha session ceka
+        async def second():
+            async with async_session_maker() as other:
+                await other.execute(sqlalchemy.text("select 1"))
+        waiting = asyncio.create_task(second())
+        await asyncio.sleep(0.1)
+        assert sample("db_pool_waiters") == 1
+    await waiting
+    assert sample("db_pool_waiters") == 0
+    assert sample("db_pool_checked_out_connections") == checkedOut
+    assert sample("db_pool_checkout_seconds_count") == checkouts + 2
+    # ostatni pooly maji vlastni serie
+    assert REGISTRY.get_sample_value("db_pool_checked_out_connections", {"pool": "replica"}) in [None, 0]
+
+
+@pytest.mark.asyncio
+async def test_start_engine_creates_missing_indexes(tmp_path):
+    connectionString = f"sqlite+aiosqlite:///{tmp_path / 'indexes.sqlite'}"
+    async_session_maker = await startEngine(connectionString, makeDrop=True, makeUp=True)
+    async with async_session_maker() as session:
+        # databaze z doby pred pridanim indexu
+        await session.execute(sqlalchemy.text("DROP INDEX ix_publication_authors_publication_id_order"))
+        await session.commit()
+
+    from src.DBDefinitions import ensureIndexes
+    engine = async_session_maker.kw["bind"]
+    assert await ensureIndexes(engine) == ["ix_publication_authors_publication_id_order"]
+    assert await ensureIndexes(engine) == []
+
+
+@pytest.mark.asyncio
+async def test_second_start_skips_schema_and_seed(tmp_path):
+    from sqlalchemy.engine import Engine
+    from src.DBFeeder import initDB
+
+    statements = []
+    def collect(conn, cursor, statement, *args):
+        statements.append(statement)
+    sqlalchemy.event.listen(Engine, "before_cursor_execute", collect)
+    try:
+        connectionString = f"sqlite+aiosqlite:///{tmp_path / 'fingerprint.sqlite'}"
+        async_session_maker = await startEngine(connectionString, makeDrop=True, makeUp=True)
+        await initDB(async_session_maker)
+        firstStart = len(statements)
+
+        statements.clear()
+        async_session_maker = await startEngine(connectionString, makeDrop=False, makeUp=True)
+        await initDB(async_session_maker)
+        assert len(statements) < firstStart / 5
+        assert not any(statement.startswith(("CREATE", "INSERT")) for statement in statements)
+
+        statements.clear()
+        async_session_maker = await startEngine(connectionString, makeDrop=False, makeUp=True, force=True)
+        await initDB(async_session_maker, force=True)
+        assert any("publications" in statement for statement in statements)
+    finally:
+        sqlalchemy.event.remove(Engine, "before_cursor_execute", collect)
+
+    async with async_session_maker() as session:
+        rows = await session.execute(sqlalchemy.select(PublicationModel))
+        assert len(rows.scalars().all()) == len(get_demodata()["publications"])
@@ -0,0 +1,38 @@
+import csv
+import io
+import json
+import pytest
+
+from src.DBExport import exportPublications, exportColumnNames
+from shared import prepare_in_memory_sqllite, prepare_demodata, get_demodata
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_in_chunks():
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+
+    statements.clear()
+    parts = [part async for part in exportPublications(async_session_maker, format="ndjson", chunkSize=2)]
+    rows = [json.loads(line) for line in "".join(parts).splitlines()]
+
+    assert sorted(row["id"] for row in rows) == sorted(f'{row["id"]}' for row in data["publications"])
+    # ceil(3 / 2) casti a jeden prazdny dotaz na konci
+    assert len(statements) == 3
+
+
+@pytest.mark.asyncio
+async def test_export_csv_with_authors():
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+    data = get_demodata()
+
+    parts = [part async for part in exportPublications(async_session_maker, format="csv", withAuthors=True, chunkSize=1)]
+    reader = csv.DictReader(io.StringIO("".join(parts)))
+    assert reader.fieldnames == exportColumnNames(withAuthors=True)
+    rows = list(reader)
+
+    authorIds = {row["author_id"] for row in rows if row["author_id"]}
+    assert authorIds == {f'{row["id"]}' for row in data["publication_authors"]}
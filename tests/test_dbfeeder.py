@@ -0,0 +1,137 @@
+import datetime
+import uuid
+
+from src.DBDefinitions import AuthorModel, PublicationModel, PublicationTypeModel
+from src.DBFeeder import readJsonTables, streamTables, get_demodata_tables, get_demodata
+
+
+def test_stream_tables_match_demodata():
+    dbModels = [PublicationModel, AuthorModel, PublicationTypeModel]
+    # mala cast vynuti deleni hodnot mezi casti souboru
+    batches = {}
+    for tableName, rows in readJsonTables("./systemdata.json", [DBModel.__tablename__ for DBModel in dbModels], batchSize=3, chunkSize=7):
+        assert 0 < len(rows) <= 3
+        batches.setdefault(tableName, []).extend(rows)
+
+    streamed = get_demodata_tables(dbModels)
+    demodata = get_demodata()
+    assert set(streamed.keys()) == set(batches.keys()) == {DBModel.__tablename__ for DBModel in dbModels}
+    for DBModel in dbModels:
+        tableName = DBModel.__tablename__
+        assert len(streamed[tableName]) == len(batches[tableName]) == len(demodata[tableName])
+        columnNames = [column.name for column in DBModel.__table__.columns]
+        for streamedRow, row in zip(streamed[tableName], demodata[tableName]):
+            for name in columnNames:
+                if name in row:
+                    assert streamedRow[name] == row[name]
+
+
+def test_stream_tables_convert_column_types():
+    for DBModel, rows in streamTables([PublicationModel], batchSize=2):
+        assert DBModel is PublicationModel
+        assert len(rows) <= 2
+        for row in rows:
+            assert isinstance(row["id"], uuid.UUID)
+            assert isinstance(row["publication_type_id"], uuid.UUID)
+            if row.get("published_date", None) is not None:
+                assert isinstance(row["published_date"], datetime.datetime)
+
+
+import pytest
+from sqlalchemy import select
+
+from shared import prepare_in_memory_sqllite
+from src.DBSeeder import upsertRows, seedModels
+
+
+@pytest.mark.asyncio
+async def test_seed_models_upsert():
+    async_session_maker = await prepare_in_memory_sqllite()
+    jsonData = get_demodata_tables([PublicationTypeModel, PublicationModel])
+    await seedModels(async_session_maker, [PublicationTypeModel, PublicationModel], jsonData)
+
+    publication = jsonData["publications"][0]
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(PublicationModel))).scalars().all()
+        assert len(rows) == len(jsonData["publications"])
+        stored = await session.get(PublicationModel, publication["id"])
+        lastchange = stored.lastchange
+
+    # opakovane ulozeni stejnych dat nic nemeni
+    await seedModels(async_session_maker, [PublicationTypeModel, PublicationModel], jsonData)
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(PublicationModel))).scalars().all()
+        assert len(rows) == len(jsonData["publications"])
+        stored = await session.get(PublicationModel, publication["id"])
+        assert stored.lastchange == lastchange
+
+    # zmeneny radek je prepsan
+    async with async_session_maker() as session:
+        await upsertRows(session, PublicationModel, [{**publication, "name": "renamed", "_chunk": 0}])
+        await session.commit()
+    async with async_session_maker() as session:
+        stored = await session.get(PublicationModel, publication["id"])
+        assert stored.name == "renamed"
+        assert stored.place == publication["place"]
+
+
+from src.DBDefinitions import SubjectModel
+from src.DBFeeder import generateSyntheticData, writeSyntheticData, dumpSyntheticData
+
+
+def test_synthetic_data_is_reproducible(tmp_path):
+    first = list(generateSyntheticData(publicationCount=50, seed=7, batchSize=20))
+    second = list(generateSyntheticData(publicationCount=50, seed=7, batchSize=20))
+    other = list(generateSyntheticData(publicationCount=50, seed=8, batchSize=20))
+    assert first == second
+    assert first != other
+    assert all(len(rows) <= 20 for _, rows in first)
+
+    counts = dumpSyntheticData(tmp_path / "synthetic.json", iter(first))
+    assert counts["publications"] == 50
+    for DBModel in [PublicationModel, AuthorModel, SubjectModel]:
+        streamed = [row for _, rows in streamTables([DBModel], path=tmp_path / "synthetic.json") for row in rows]
+        generated = [row for model, rows in first if model is DBModel for row in rows]
+        assert streamed == generated
+
+
+@pytest.mark.asyncio
+async def test_synthetic_data_write():
+    async_session_maker = await prepare_in_memory_sqllite()
+    counts = await writeSyntheticData(async_session_maker, generateSyntheticData(publicationCount=30, batchSize=7))
+    assert counts["publications"] == 30
+    # opakovany zapis je idempotentni
+    assert counts == await writeSyntheticData(async_session_maker, generateSyntheticData(publicationCount=30, batchSize=7))
+    async with async_session_maker() as session:
+        authors = (await session.execute(select(AuthorModel))).scalars().all()
+        assert len(authors) == counts["publication_authors"]
+
+
+from src.DBFeeder import putPredefinedStructuresIntoTable, types1, types2
+
+
+@pytest.mark.asyncio
+async def test_put_predefined_structures_inserts_missing_only():
+    async_session_maker = await prepare_in_memory_sqllite()
+    summary = await putPredefinedStructuresIntoTable(async_session_maker, PublicationTypeModel, types1, batchSize=2)
+    assert summary == {"table": "publicationtypes", "expected": 3, "present": 0, "inserted": 3}
+
+    summary = await putPredefinedStructuresIntoTable(async_session_maker, PublicationTypeModel, lambda: [*types1(), *types2()], batchSize=2)
+    assert summary == {"table": "publicationtypes", "expected": 6, "present": 3, "inserted": 3}
+
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(PublicationTypeModel))).scalars().all()
+        assert sorted(row.name for row in rows) == sorted(row["name"] for row in [*types1(), *types2()])
+
+
+from src.DBDefinitions import PublicationCategoryModel
+from src.DBSeeder import dependencyLevels
+
+
+def test_dependency_levels():
+    levels = dependencyLevels([SubjectModel, AuthorModel, PublicationModel, PublicationTypeModel, PublicationCategoryModel])
+    assert levels[:3] == [[PublicationCategoryModel], [PublicationTypeModel], [PublicationModel]]
+    assert set(levels[3]) == {SubjectModel, AuthorModel}
+    # bez typu publikaci jsou publikace nezavisle
+    assert dependencyLevels([AuthorModel, PublicationModel]) == [[PublicationModel], [AuthorModel]]
+    assert dependencyLevels([PublicationModel, PublicationCategoryModel]) == [[PublicationModel, PublicationCategoryModel]]
@@ -9,7 +9,7 @@ import pytest
 
 # from ..uoishelpers.uuid import UUIDColumn
 
-from gql_publications.GraphTypeDefinitions import schema
+from src.GraphTypeDefinitions import schema
 
 from shared import (
     prepare_demodata,
@@ -109,6 +109,28 @@ def createResolveReferenceTest(tableName, gqltype, attributeNames=["id", "name"]
 
     return result_test
 
+@pytest.mark.asyncio
+async def test_user_author_publications_from_entities():
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+
+    data = get_demodata()
+    author = data["publication_authors"][0]
+    userId = f'{author["user_id"]}'
+    authorIds = {f'{row["id"]}' for row in data["publication_authors"] if f'{row["user_id"]}' == userId}
+
+    # id z reprezentace je str, fkey loader jej musi prevest na UUID
+    query = (
+        'query { _entities(representations: [{ __typename: "UserGQLModel", id: "' + userId + '" }])'
+        '{ ...on UserGQLModel { id authorPublications { id } } } }'
+    )
+    context_value = await createContext(async_session_maker)
+    resp = await schema.execute(query, context_value=context_value)
+    assert resp.errors is None
+    entity = resp.data["_entities"][0]
+    assert entity["id"] == userId
+    assert {row["id"] for row in entity["authorPublications"]} == authorIds
+
 #test_query_event_by_id = createByIdTest(tableName="surveys", queryEndpoint="surveyById")
 #test_answer_by_id = createByIdTest(tableName="surveyquestions", queryEndpoint="questionById")
 #test_question_type_by_id = createByIdTest(tableName="surveyquestiontypes", queryEndpoint="questionTypeById")
@@ -169,7 +191,7 @@ async def test_publication_mutation():
     name = "NewName"
     query = '''
             mutation(
-                $id: ID!,
+                $id: UUID!,
                 $lastchange: DateTime!
                 $name: String!
                 ) {
@@ -206,3 +228,236 @@ async def test_publication_mutation():
     assert data['msg'] == "fail"
 
     pass
+
+
+@pytest.mark.asyncio
+async def test_publication_author_insert_many():
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+
+    data = get_demodata()
+    publicationId = f'{data["publications"][0]["id"]}'
+    existingId = f'{data["publication_authors"][0]["id"]}'
+    userId = "2d9dc5ca-a4a2-11ed-b9df-0242ac120003"
+
+    query = '''
+            mutation($authors: [PublicationAuthorInsertGQLModel!]!) {
+                operation: publicationAuthorInsertMany(authors: $authors) {
+                    id
+                    msg
+                    entity: author { id order }
+                }
+            }
+        '''
+    authors = [
+        {"publicationId": publicationId, "userId": userId, "order": order, "id": None}
+        for order in range(20, 25)
+    ]
+    # jiz existujici id a neexistujici publikace
+    authors.append({"publicationId": publicationId, "userId": userId, "order": 1, "id": existingId})
+    authors.append({"publicationId": "bd2d3b88-1d4e-4cb3-93de-6d8c8c93f0c1", "userId": userId, "order": 1, "id": None})
+
+    context_value = await createContext(async_session_maker)
+    resp = await schema.execute(query, context_value=context_value, variable_values={"authors": authors})
+    assert resp.errors is None
+
+    results = resp.data["operation"]
+    assert [result["msg"] for result in results] == 5 * ["ok"] + 2 * ["fail"]
+    assert [result["entity"]["order"] for result in results[:5]] == list(range(20, 25))
+
+
+@pytest.mark.asyncio
+async def test_publication_author_update_many():
+    import datetime
+    from src.DBDefinitions import AuthorModel
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+    authorIds = [row["id"] for row in get_demodata()["publication_authors"][:2]]
+    async with async_session_maker() as session:
+        rows = await session.execute(sqlalchemy.select(AuthorModel).where(AuthorModel.id.in_(authorIds)))
+        rows = list(rows.scalars())
+        lastchanges = {row.id: row.lastchange for row in rows}
+        assert 0.25 not in [row.share for row in rows]
+
+    query = '''
+            mutation($authors: [PublicationAuthorUpdateGQLModel!]!) {
+                operation: publicationAuthorUpdateMany(authors: $authors) {
+                    id
+                    msg
+                    entity: author { id share }
+                }
+            }
+        '''
+    authors = [
+        {"id": f"{id}", "lastchange": lastchanges[id].isoformat(), "share": 0.25, "order": None}
+        for id in authorIds
+    ]
+    # zastaraly lastchange
+    authors[1]["lastchange"] = datetime.datetime(2000, 1, 1).isoformat()
+
+    context_value = await createContext(async_session_maker)
+    resp = await schema.execute(query, context_value=context_value, variable_values={"authors": authors})
+    assert resp.errors is None
+    results = resp.data["operation"]
+    assert [result["msg"] for result in results] == ["ok", "fail"]
+    assert results[0]["entity"]["share"] == 0.25
+
+    async with async_session_maker() as session:
+        rows = await session.execute(sqlalchemy.select(AuthorModel).where(AuthorModel.id.in_(authorIds)))
+        shares = {row.id: row.share for row in rows.scalars()}
+    assert shares[authorIds[0]] == 0.25
+    assert shares[authorIds[1]] != 0.25
+
+
+@pytest.mark.asyncio
+async def test_publication_author_move():
+    import uuid
+    import datetime
+    from src.DBDefinitions import AuthorModel
+
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+
+    publicationId = get_demodata()["publications"][0]["id"]
+    lastchange = datetime.datetime(2024, 1, 1)
+    authorIds = [uuid.uuid4() for _ in range(4)]
+    async with async_session_maker() as session:
+        await session.execute(sqlalchemy.delete(AuthorModel).where(AuthorModel.publication_id == publicationId))
+        for order, id in enumerate(authorIds, start=1):
+            session.add(AuthorModel(id=id, publication_id=publicationId, order=order, lastchange=lastchange))
+        await session.commit()
+
+    query = '''
+            mutation($id: UUID!, $lastchange: DateTime!, $order: Int!) {
+                operation: publicationAuthorMove(author: {id: $id, lastchange: $lastchange, order: $order}) {
+                    id
+                    msg
+                }
+            }
+        '''
+    variable_values = {"id": f"{authorIds[3]}", "lastchange": lastchange.isoformat(), "order": 1}
+    context_value = await createContext(async_session_maker)
+    statements.clear()
+    resp = await schema.execute(query, context_value=context_value, variable_values=variable_values)
+    assert resp.errors is None
+    assert resp.data["operation"]["msg"] == "ok"
+    assert len([statement for statement in statements if statement.startswith("UPDATE")]) == 1
+
+    async with async_session_maker() as session:
+        rows = await session.execute(
+            sqlalchemy.select(AuthorModel.id).where(AuthorModel.publication_id == publicationId).order_by(AuthorModel.order))
+        assert list(rows.scalars()) == [authorIds[3], *authorIds[:3]]
+
+    # pozice mimo 1 .. pocet autoru
+    async with async_session_maker() as session:
+        lastchange = (await session.get(AuthorModel, authorIds[0])).lastchange
+    for order in [0, -3, 5, 99]:
+        outOfRange = {"id": f"{authorIds[0]}", "lastchange": lastchange.isoformat(), "order": order}
+        resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=outOfRange)
+        assert resp.errors is None
+        assert resp.data["operation"]["msg"] == "fail"
+    # krajni pozice jsou povoleny
+    moveToEnd = {"id": f"{authorIds[0]}", "lastchange": lastchange.isoformat(), "order": 4}
+    resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=moveToEnd)
+    assert resp.data["operation"]["msg"] == "ok"
+    async with async_session_maker() as session:
+        rows = await session.execute(
+            sqlalchemy.select(AuthorModel.id, AuthorModel.order).where(AuthorModel.publication_id == publicationId).order_by(AuthorModel.order))
+        assert list(rows) == list(zip([authorIds[3], *authorIds[1:3], authorIds[0]], range(1, 5)))
+
+    # lastchange uz neodpovida
+    resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=variable_values)
+    assert resp.errors is None
+    assert resp.data["operation"]["msg"] == "fail"
+
+    # neexistujici autor
+    variable_values = {**variable_values, "id": f"{uuid.uuid4()}"}
+    resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=variable_values)
+    assert resp.errors is None
+    assert resp.data["operation"]["msg"] == "fail"
+
+
+@pytest.mark.asyncio
+async def test_publication_update_single_statement():
+    statements = []
+    async_session_maker = await prepare_in_memory_sqllite(statements)
+    await prepare_demodata(async_session_maker)
+    publication = get_demodata()["publications"][0]
+
+    from src.DBDefinitions import PublicationModel
+    async with async_session_maker() as session:
+        lastchange = (await session.get(PublicationModel, publication["id"])).lastchange
+
+    query = '''
+            mutation($id: UUID!, $lastchange: DateTime!) {
+                operation: publicationUpdate(publication: {id: $id, lastchange: $lastchange, name: "CAS"}) {
+                    msg
+                    entity: publication { name }
+                }
+            }
+        '''
+    variable_values = {"id": f'{publication["id"]}', "lastchange": lastchange.isoformat()}
+    statements.clear()
+    resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=variable_values)
+    assert resp.errors is None
+    assert resp.data["operation"] == {"msg": "ok", "entity": {"name": "CAS"}}
+    # jen UPDATE ... RETURNING, vysledek je vlozen do loaderu
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE")
+
+    resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=variable_values)
+    assert resp.errors is None
+    assert resp.data["operation"]["msg"] == "fail"
+
+
+@pytest.mark.asyncio
+async def test_publication_search():
+    async_session_maker = await prepare_in_memory_sqllite()
+    await prepare_demodata(async_session_maker)
+
+    query = '''
+            query($query: String!, $limit: Int, $after: String) {
+                result: publicationSearch(query: $query, limit: $limit, after: $after) {
+                    items { id name }
+                    endCursor
+                    hasNextPage
+                }
+            }
+        '''
+
+    async def search(**variable_values):
+        resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values=variable_values)
+        assert resp.errors is None
+        return resp.data["result"]
+
+    result = await search(query="technologie III")
+    assert [item["name"] for item in result["items"]] == ["IT Technologie III"]
+
+    names = []
+    after = None
+    while True:
+        result = await search(query="Prague", limit=1, after=after)
+        names.extend(item["name"] for item in result["items"])
+        after = result["endCursor"]
+        if not result["hasNextPage"]:
+            break
+    assert sorted(names) == sorted(row["name"] for row in get_demodata()["publications"])
+
+    # index je udrzovan i pro nove publikace
+    mutation = 'mutation { publicationInsert(publication: {name: "Distributed databases", place: "Brno"}) { msg } }'
+    resp = await schema.execute(mutation, context_value=await createContext(async_session_maker))
+    assert resp.errors is None
+    result = await search(query="databases brno")
+    assert [item["name"] for item in result["items"]] == ["Distributed databases"]
+
+    result = await search(query="   ")
+    assert result["items"] == []
+
+    # limit musi byt alespon 1, null neni dovolen
+    for limit in [0, -5, None]:
+        resp = await schema.execute(query, context_value=await createContext(async_session_maker), variable_values={"query": "Prague", "limit": limit})
+        assert resp.errors is not None
+    result = await search(query="Prague", limit=10 ** 9)
+    assert len(result["items"]) == len(get_demodata()["publications"])
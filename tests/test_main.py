@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import pytest
+
+
+@pytest.fixture
+def main(monkeypatch, tmp_path):
+    monkeypatch.setenv("DEMO", "True")
+    monkeypatch.setenv("JWTPUBLICKEYURL", "http://localhost:8000/oauth/publickey")
+    monkeypatch.setenv("JWTRESOLVEUSERPATHURL", "http://localhost:8000/oauth/userinfo")
+    monkeypatch.setenv("CONNECTIONSTRING", f"sqlite+aiosqlite:///{tmp_path / 'main.sqlite'}")
+    import main
+    return importlib.reload(main)
+
+
+@pytest.mark.asyncio
+async def test_single_call_single_flight(main):
+    calls = []
+
+    @main.singleCall
+    async def init():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("first attempt fails")
+        return len(calls)
+
+    results = await asyncio.gather(*(init() for _ in range(5)), return_exceptions=True)
+    # soubezna volani cekaji na tentyz beh
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    # po chybe je beh spusten znovu, pak uz je vysledek zapamatovan
+    results = await asyncio.gather(*(init() for _ in range(5)))
+    assert results == 5 * [2]
+    assert await init() == 2
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_call_survives_cancelled_waiter(main):
+    calls = []
+
+    @main.singleCall
+    async def init():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    first = asyncio.ensure_future(init())
+    second = asyncio.ensure_future(init())
+    await asyncio.sleep(0.01)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    # zruseni prvniho volani beh neprerusi
+    assert await second == 1
+    assert await init() == 1
+    assert len(calls) == 1
+
+    # zruseny beh neni zapamatovan
+    @main.singleCall
+    async def cancelledInit():
+        calls.append(2)
+        if calls.count(2) == 1:
+            raise asyncio.CancelledError()
+        return "ok"
+
+    with pytest.raises(asyncio.CancelledError):
+        await cancelledInit()
+    assert await cancelledInit() == "ok"
+
+
+def test_health_endpoints(main):
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        response = client.get("/health/live")
+        assert response.status_code == 200
+
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+        assert response.json()["db_ping_ms"] >= 0